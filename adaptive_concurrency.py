@@ -0,0 +1,94 @@
+import threading
+import time
+
+# Minimum time between two decreases of one host's limit, so a burst of failures from requests
+# that were all in flight together counts as a single congestion event
+DECREASE_WINDOW = 1.0
+
+# Latency and limit state of one host
+class _HostLimit:
+    def __init__(self, initial):
+        self.limit = float(initial)
+        self.in_flight = 0
+        self.latency = None        # Smoothed recent latency
+        self.baseline = None       # Lowest smoothed latency seen, drifting slowly upwards
+        self.slow_start = True     # Until the first congestion event the limit grows per success
+        self.last_decrease = 0.0
+
+# Additive-increase / multiplicative-decrease limit on in-flight requests, kept per host.
+# While the host's smoothed latency stays within latency_tolerance x its baseline, each success
+# raises the limit by about one per round trip (by one per success during slow start); a
+# throttled, failed or timed out request cuts it by backoff, and latency climbing past the
+# tolerance (requests queueing at the server) trims it gently. Each host settles near its best throughput on its own.
+# Callers never block in here: try_acquire() says whether a request may start now and release()
+# must follow every successful try_acquire().
+class AdaptiveConcurrency:
+    def __init__(self, initial=8, min_limit=1, max_limit=100, backoff=0.5, latency_tolerance=2.0):
+        self.initial = min(max_limit, max(min_limit, initial))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _host(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostLimit(self.initial)
+        return state
+
+    def try_acquire(self, host):
+        with self._lock:
+            state = self._host(host)
+            if state.in_flight < int(state.limit):
+                state.in_flight += 1
+                return True
+            return False
+
+    # Function to get how many more requests a host would accept right now
+    def free_slots(self, host):
+        with self._lock:
+            state = self._host(host)
+            return max(0, int(state.limit) - state.in_flight)
+
+    # Function to end a request: latency (seconds) for a success, congested=True for a throttled,
+    # failed or timed out one, neither for an answer that says nothing about load (e.g. a 404)
+    def release(self, host, latency=None, congested=False):
+        with self._lock:
+            state = self._host(host)
+            state.in_flight -= 1
+            if congested:
+                self._decrease(state, self.backoff)
+            elif latency is not None:
+                if state.latency is None:
+                    state.latency = state.baseline = latency
+                else:
+                    state.latency += 0.1 * (latency - state.latency)
+                    if state.latency < state.baseline:
+                        state.baseline = state.latency
+                    else:
+                        state.baseline += 0.001 * (state.latency - state.baseline)
+                if state.latency > self.latency_tolerance * state.baseline:
+                    self._decrease(state, 0.9)
+                elif state.slow_start:
+                    state.limit = min(self.max_limit, state.limit + 1)
+                else:
+                    state.limit = min(self.max_limit, state.limit + 1 / state.limit)
+
+    def _decrease(self, state, factor):
+        now = time.monotonic()
+        if now - state.last_decrease < DECREASE_WINDOW:
+            return
+        state.last_decrease = now
+        state.slow_start = False
+        state.limit = max(self.min_limit, state.limit * factor)
+
+    def limit(self, host):
+        with self._lock:
+            return int(self._host(host).limit)
+
+    # Function to get the current limit of every host seen so far
+    def limits(self):
+        with self._lock:
+            return {host: int(state.limit) for host, state in self._hosts.items()}
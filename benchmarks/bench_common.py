@@ -0,0 +1,88 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Repository root, where the scripts under test live
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Function to get the p-th percentile (0-100) of a list of numbers (None when it is empty)
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+# Function to run a command to completion; returns (seconds, peak RSS in bytes or None, exit code).
+# Peak RSS is the high-water mark of the command's own process (worker processes it starts are not
+# counted), polled from /proc/<pid>/status on Linux, otherwise from psutil if it is installed.
+# wait4's ru_maxrss is not used: Linux carries the harness's own peak over into every child it starts.
+def run_measured(command, cwd=REPO_ROOT):
+    with tempfile.TemporaryFile() as stderr:
+        start = time.perf_counter()
+        process = subprocess.Popen(command, cwd=cwd, stdout=subprocess.DEVNULL, stderr=stderr)
+        peak_rss = _poll_peak_rss(process)
+        seconds = time.perf_counter() - start
+
+        if process.returncode != 0:
+            stderr.seek(0)
+            print(stderr.read().decode(errors='replace')[-2000:], file=sys.stderr)
+    return seconds, peak_rss, process.returncode
+
+# Function to read a process's peak RSS so far (VmHWM, Linux only); None once it is gone
+def _proc_peak_rss(pid):
+    try:
+        with open(f"/proc/{pid}/status", encoding='ascii') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def _poll_peak_rss(process):
+    if os.path.exists(f"/proc/{process.pid}/status"):
+        read_rss = _proc_peak_rss
+    else:
+        try:
+            import psutil
+        except ImportError:
+            process.wait()
+            return None
+        watched = psutil.Process(process.pid)
+
+        def read_rss(pid):
+            try:
+                return watched.memory_info().rss
+            except psutil.Error:
+                return None
+    peak = 0
+    while process.poll() is None:
+        peak = max(peak, read_rss(process.pid) or 0)
+        time.sleep(0.02)
+    return peak or None
+
+# Function to print result rows as an aligned table
+def print_table(rows, columns):
+    cells = [[_format(row.get(column)) for column in columns] for row in rows]
+    widths = [max(len(column), *(len(line[i]) for line in cells)) for i, column in enumerate(columns)]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)).rstrip())
+    for line in cells:
+        print("  ".join(cell.ljust(width) for cell, width in zip(line, widths)).rstrip())
+
+def _format(value):
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.3f}" if value < 10 else f"{value:.1f}"
+    return str(value)
+
+# Function to save the results of a run, so numbers can be compared release to release
+def write_results(path, benchmark, settings, rows):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump({'benchmark': benchmark, 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'python': sys.version.split()[0], 'settings': settings, 'results': rows}, file, indent=2)
+    print(f"Results written to {path}")
@@ -0,0 +1,100 @@
+import argparse
+import csv
+import os
+import shlex
+import sys
+import tempfile
+
+from bench_common import REPO_ROOT, percentile, print_table, run_measured, write_results
+from cdn_server import StandInCdn, add_server_arguments, serve_in_thread
+
+BENCH_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+# Download entry points: name -> (sheet layout, how to build the command line)
+ENTRY_POINTS = {
+    'download-multi-images': ('wide', lambda sheet, output, extra: [
+        sys.executable, os.path.join(REPO_ROOT, 'download-multi-images.py'),
+        '--csv', sheet, '--save-folder', output, *extra]),
+    'download-by-column': ('long', lambda sheet, output, extra: [
+        sys.executable, os.path.join(REPO_ROOT, 'download-by-column.py'),
+        '--csv', sheet, '--save-folder', output, *extra]),
+    'webscrape': ('wide', lambda sheet, output, extra: [
+        sys.executable, os.path.join(BENCH_FOLDER, 'scraper_download_stage.py'), 'webscrape', sheet, output]),
+    'betterwebscrape': ('wide', lambda sheet, output, extra: [
+        sys.executable, os.path.join(BENCH_FOLDER, 'scraper_download_stage.py'), 'betterwebscrape', sheet, output]),
+}
+
+COLUMNS = ['entry_point', 'images', 'seconds', 'images_per_s', 'mb_per_s',
+           'p50_ms', 'p95_ms', 'p99_ms', 'peak_rss_mb', '429', '503', 'aborted']
+
+# Function to write the generated sheets: the same URLs as a wide sheet (one row per part) and as
+# a long sheet (one row per image)
+def write_sheets(folder, port, parts, images_per_part):
+    wide_path = os.path.join(folder, 'wide.csv')
+    long_path = os.path.join(folder, 'long.csv')
+    with open(wide_path, 'w', newline='') as wide_file, open(long_path, 'w', newline='') as long_file:
+        wide = csv.writer(wide_file)
+        long = csv.writer(long_file)
+        wide.writerow(['part_number', 'image_url'] + [f'image_url_{i}' for i in range(1, images_per_part)])
+        long.writerow(['part_number', 'image_url'])
+        for part in range(parts):
+            part_number = f"BENCH{part:06d}"
+            urls = [f"http://127.0.0.1:{port}/img/{part_number}_{i}.jpg" for i in range(images_per_part)]
+            wide.writerow([part_number] + urls)
+            long.writerows([part_number, url] for url in urls)
+    return {'wide': wide_path, 'long': long_path}
+
+# Function to run one entry point against a freshly reset CDN and summarize what it served
+def bench_entry_point(name, cdn, sheets, work_folder, extra_args):
+    layout, build_command = ENTRY_POINTS[name]
+    output = os.path.join(work_folder, name)
+    cdn.reset()
+    seconds, peak_rss, exit_code = run_measured(build_command(sheets[layout], output, extra_args))
+    images = cdn.statuses.get('200', 0)
+    latencies_ms = [latency * 1000 for latency in cdn.latencies]
+    return {
+        'entry_point': name if exit_code == 0 else f"{name} (exit {exit_code})",
+        'images': images,
+        'seconds': seconds,
+        'images_per_s': images / seconds,
+        'mb_per_s': cdn.bytes_sent / seconds / 1e6,
+        'p50_ms': percentile(latencies_ms, 50),
+        'p95_ms': percentile(latencies_ms, 95),
+        'p99_ms': percentile(latencies_ms, 99),
+        'peak_rss_mb': peak_rss / 1e6 if peak_rss else None,
+        '429': cdn.statuses.get('429', 0),
+        '503': cdn.statuses.get('503', 0),
+        'aborted': cdn.aborted,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the download entry points against a local stand-in CDN")
+    add_server_arguments(parser)
+    parser.add_argument('--parts', type=int, default=500, help="Part numbers in the generated sheets")
+    parser.add_argument('--images-per-part', type=int, default=4)
+    parser.add_argument('--entry-point', action='append', choices=sorted(ENTRY_POINTS),
+                        help="Entry point to run (repeatable; default: all)")
+    parser.add_argument('--download-args', default='',
+                        help="Extra arguments for the CSV download scripts, e.g. --download-args=\"--process --blob-store\"")
+    parser.add_argument('--json', help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    cdn = StandInCdn(args)
+    serve_in_thread(cdn, args.port)
+    print(f"Stand-in CDN on port {args.port}: {len(cdn.image)} byte images, latency {args.latency}s, "
+          f"errors {args.error_rate:.0%}, 429s {args.throttle_rate:.0%}, stalls {args.stall_rate:.0%}")
+
+    rows = []
+    with tempfile.TemporaryDirectory() as work_folder:
+        sheets = write_sheets(work_folder, args.port, args.parts, args.images_per_part)
+        for name in args.entry_point or list(ENTRY_POINTS):
+            print(f"Running {name}...")
+            rows.append(bench_entry_point(name, cdn, sheets, work_folder, shlex.split(args.download_args)))
+
+    print_table(rows, COLUMNS)
+    if args.json:
+        settings = {key: value for key, value in vars(args).items() if key != 'json'}
+        write_results(args.json, 'downloads', settings, rows)
+
+if __name__ == "__main__":
+    main()
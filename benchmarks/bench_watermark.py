@@ -0,0 +1,75 @@
+import argparse
+import os
+import sys
+import tempfile
+
+import cv2
+import numpy as np
+
+from bench_common import REPO_ROOT, print_table, run_measured, write_results
+
+# remove-watermark.py settings to compare: name -> extra arguments
+MODES = {
+    'serial': ['--workers', '1'],
+    'pool': [],
+    'shared-mask': ['--shared-mask'],
+    'shared-mask-roi': ['--shared-mask', '--roi'],
+}
+
+COLUMNS = ['mode', 'images', 'seconds', 'images_per_s', 'ms_per_image', 'peak_rss_mb']
+
+# Function to write a synthetic supplier set: different products (random shapes on a gradient)
+# under the same watermark text in the same place
+def write_images(folder, count, width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(180, 255, width, dtype=np.uint8)
+    for i in range(count):
+        image = np.empty((height, width, 3), np.uint8)
+        image[:] = gradient[None, :, None]
+        for _ in range(6):
+            center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+            axes = (int(rng.integers(20, width // 4)), int(rng.integers(20, height // 4)))
+            color = tuple(int(c) for c in rng.integers(0, 200, 3))
+            cv2.ellipse(image, center, axes, float(rng.integers(0, 180)), 0, 360, color, -1)
+        cv2.putText(image, "SAMPLE WATERMARK", (width // 6, height // 2), cv2.FONT_HERSHEY_SIMPLEX,
+                    width / 600, (255, 255, 255), max(2, width // 300), cv2.LINE_AA)
+        cv2.imwrite(os.path.join(folder, f"bench_{i:05d}.jpg"), image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark remove-watermark.py on a synthetic image set")
+    parser.add_argument('--images', type=int, default=200)
+    parser.add_argument('--width', type=int, default=1600)
+    parser.add_argument('--height', type=int, default=1200)
+    parser.add_argument('--mode', action='append', choices=list(MODES), help="Mode to run (repeatable; default: all)")
+    parser.add_argument('--json', help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as work_folder:
+        input_folder = os.path.join(work_folder, 'input')
+        os.makedirs(input_folder)
+        write_images(input_folder, args.images, args.width, args.height)
+
+        for mode in args.mode or list(MODES):
+            print(f"Running {mode}...")
+            # Every mode starts cold: its own output folder, so no outputs or cached masks are reused
+            command = [sys.executable, os.path.join(REPO_ROOT, 'remove-watermark.py'),
+                       '--input-folder', input_folder,
+                       '--output-folder', os.path.join(work_folder, mode), *MODES[mode]]
+            seconds, peak_rss, exit_code = run_measured(command)
+            rows.append({
+                'mode': mode if exit_code == 0 else f"{mode} (exit {exit_code})",
+                'images': args.images,
+                'seconds': seconds,
+                'images_per_s': args.images / seconds,
+                'ms_per_image': seconds / args.images * 1000,
+                'peak_rss_mb': peak_rss / 1e6 if peak_rss else None,
+            })
+
+    print_table(rows, COLUMNS)
+    if args.json:
+        settings = {key: value for key, value in vars(args).items() if key != 'json'}
+        write_results(args.json, 'watermark', settings, rows)
+
+if __name__ == "__main__":
+    main()
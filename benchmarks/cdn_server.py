@@ -0,0 +1,131 @@
+import argparse
+import asyncio
+import random
+import threading
+import time
+
+from aiohttp import web
+
+CHUNK_SIZE = 16 * 1024
+
+# Function to build the image every URL serves: a real JPEG when OpenCV is available (so the
+# --process stage can decode it), otherwise JPEG magic bytes padded to the same order of size
+def build_image(width, height):
+    try:
+        import cv2
+        import numpy as np
+    except ImportError:
+        return b'\xff\xd8\xff\xe0' + bytes(range(256)) * (width * height // 2560)
+    rng = np.random.default_rng(0)
+    image = cv2.GaussianBlur(rng.integers(0, 256, (height, width, 3), dtype=np.uint8), (9, 9), 0)
+    return cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+
+# Stand-in image CDN: every /img/<name> serves the same synthetic image after the configured
+# latency, at the configured bandwidth, with random 5xx errors, 429s and mid-body stalls.
+# /stats reports what was served, /reset clears it between benchmark runs.
+class StandInCdn:
+    def __init__(self, args):
+        self.args = args
+        self.image = build_image(args.width, args.height)
+        self.random = random.Random(args.seed)
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.statuses = {}
+        self.bytes_sent = 0
+        self.latencies = []  # Request start to last byte, completed 200s only
+        self.aborted = 0
+
+    def _count(self, status):
+        self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+
+    async def serve_image(self, request):
+        start = time.perf_counter()
+        self.requests += 1
+        args = self.args
+        if args.latency:
+            await asyncio.sleep(args.latency * self.random.uniform(0.5, 1.5))
+
+        roll = self.random.random()
+        if roll < args.throttle_rate:
+            self._count(429)
+            return web.Response(status=429, headers={'Retry-After': str(args.retry_after)})
+        if roll < args.throttle_rate + args.error_rate:
+            self._count(503)
+            return web.Response(status=503)
+
+        stall_at = len(self.image) // 2 if self.random.random() < args.stall_rate else None
+        response = web.StreamResponse(headers={'Content-Type': 'image/jpeg', 'ETag': '"bench"'})
+        response.content_length = len(self.image)
+        try:
+            await response.prepare(request)
+            for offset in range(0, len(self.image), CHUNK_SIZE):
+                if stall_at is not None and offset >= stall_at:
+                    await asyncio.sleep(args.stall_seconds)
+                    stall_at = None
+                chunk = self.image[offset:offset + CHUNK_SIZE]
+                await response.write(chunk)
+                self.bytes_sent += len(chunk)
+                if args.bandwidth:
+                    await asyncio.sleep(len(chunk) / args.bandwidth)
+            await response.write_eof()
+        except ConnectionResetError:
+            self.aborted += 1  # The client gave up on a slow or stalled body
+            return response
+        except asyncio.CancelledError:
+            self.aborted += 1
+            raise
+        self._count(200)
+        self.latencies.append(time.perf_counter() - start)
+        return response
+
+    async def stats(self, request):
+        return web.json_response({
+            'requests': self.requests,
+            'statuses': self.statuses,
+            'bytes_sent': self.bytes_sent,
+            'latencies': self.latencies,
+            'aborted': self.aborted,
+        })
+
+    async def reset_stats(self, request):
+        self.reset()
+        return web.json_response({'ok': True})
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get('/img/{name}', self.serve_image)
+        app.router.add_get('/stats', self.stats)
+        app.router.add_post('/reset', self.reset_stats)
+        return app
+
+def add_server_arguments(parser):
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--latency', type=float, default=0.02, help="Seconds before each response (jittered +-50%%)")
+    parser.add_argument('--bandwidth', type=float, default=0, help="Bytes/s per response (0: unlimited)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of requests answered 503")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="Share of requests answered 429")
+    parser.add_argument('--retry-after', type=int, default=1, help="Retry-After sent with each 429")
+    parser.add_argument('--stall-rate', type=float, default=0.0, help="Share of bodies that stall halfway")
+    parser.add_argument('--stall-seconds', type=float, default=15.0, help="How long a stalled body hangs")
+    parser.add_argument('--width', type=int, default=800, help="Synthetic image width")
+    parser.add_argument('--height', type=int, default=600, help="Synthetic image height")
+    parser.add_argument('--seed', type=int, default=0)
+
+# Function to serve the CDN from a background thread, for benchmarks that read its counters directly
+def serve_in_thread(cdn, port):
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(cdn.app())
+    loop.run_until_complete(runner.setup())
+    loop.run_until_complete(web.TCPSite(runner, '127.0.0.1', port).start())
+    threading.Thread(target=loop.run_forever, name='stand-in-cdn', daemon=True).start()
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in image CDN for benchmarks")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    web.run_app(StandInCdn(args).app(), host='127.0.0.1', port=args.port, print=None)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import argparse
+import os
+import sys
+
+from bench_common import REPO_ROOT
+from supersprint_site import PAGES_FOLDER, StandInSite, serve_in_thread
+
+sys.path.insert(0, REPO_ROOT)
+
+PRODUCT_IMAGES = ['/img/ss-1001_01.jpg', '/img/ss-1001_02.jpg', '/img/ss-1001_03.jpg']
+
+# Function to read a fixture page
+def read_page(filename):
+    with open(os.path.join(PAGES_FOLDER, filename), encoding='utf-8') as file:
+        return file.read()
+
+# Checks the Supersprint HTTP fast path (supersprint_http.py) against the stand-in site: the
+# parsers on the fixture pages, then resolve_product_image_urls over real requests, including
+# the None that sends the scrapers to the browser fallback. Exits 1 if any check fails.
+def main():
+    parser = argparse.ArgumentParser(description="Check the Supersprint HTTP fast path against a local stand-in site")
+    parser.add_argument('--port', type=int, default=8810)
+    args = parser.parse_args()
+
+    site = StandInSite()
+    serve_in_thread(site, args.port)
+    # supersprint_http reads the site root when it is imported
+    os.environ['SUPERSPRINT_BASE_URL'] = f"http://127.0.0.1:{args.port}"
+    os.environ.pop('SUPERSPRINT_SEARCH_PATH', None)
+    import supersprint_http
+
+    results_page = read_page('search_results.html')
+    checks = [
+        ("carousel images parsed from the product page",
+         supersprint_http.parse_product_image_urls(read_page('product.html')), PRODUCT_IMAGES),
+        ("no images parsed from a page without the carousel",
+         supersprint_http.parse_product_image_urls(read_page('no_carousel.html')), []),
+        ("product link found on the results page",
+         supersprint_http.find_product_link(results_page, 'SS-1001'), '/en-us/products/ss-1001.aspx'),
+        ("pagination links that echo the query are skipped",
+         supersprint_http.find_product_link(results_page, 'SS-3003'), '/en-us/products/ss-3003.aspx'),
+        ("no link for a part number that is not listed",
+         supersprint_http.find_product_link(results_page, 'SS-9999'), None),
+        ("no link for a part number that is only a prefix of a listed one",
+         supersprint_http.find_product_link(results_page, 'SS-100'), None),
+        ("no link when the part number matches more than one product",
+         supersprint_http.find_product_link(results_page, 'SS-5005'), None),
+        ("resolved via the results page",
+         supersprint_http.resolve_product_image_urls('SS-1001'), PRODUCT_IMAGES),
+        ("resolved when the search lands on the product page",
+         supersprint_http.resolve_product_image_urls('SS-2002'), PRODUCT_IMAGES),
+        ("browser fallback (None) for a product page without the carousel",
+         supersprint_http.resolve_product_image_urls('SS-3003'), None),
+        ("browser fallback (None) for a part number without results",
+         supersprint_http.resolve_product_image_urls('SS-9999'), None),
+        ("browser fallback (None) for a prefix of a listed part number",
+         supersprint_http.resolve_product_image_urls('SS-100'), None),
+        ("relative image URLs made absolute",
+         supersprint_http.absolute_url(PRODUCT_IMAGES[0]), f"http://127.0.0.1:{args.port}{PRODUCT_IMAGES[0]}"),
+    ]
+
+    failed = 0
+    for name, got, expected in checks:
+        ok = got == expected
+        failed += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {name}" + ("" if ok else f": got {got!r}, expected {expected!r}"))
+    print(f"{len(checks) - failed} of {len(checks)} checks passed; requests served: {site.requests}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import csv
+import os
+import sys
+
+from bench_common import REPO_ROOT
+
+sys.path.insert(0, REPO_ROOT)
+
+from run_manifest import RunManifest
+from scrape_pipeline import run_pipeline
+
+# Runs the download stage of a Supersprint scraper (webscrape or betterwebscrape) on the URLs of a
+# wide sheet, with the browser stage replaced by a lookup, so only the image transfers are measured.
+# usage: python scraper_download_stage.py <webscrape|betterwebscrape> <wide csv> <output folder>
+def main():
+    module_name, csv_file, output_folder = sys.argv[1:4]
+    scraper = __import__(module_name)
+    scraper.IMAGES_FOLDER = output_folder
+    os.makedirs(output_folder, exist_ok=True)
+
+    image_urls = {}
+    with open(csv_file, newline='', encoding='utf-8') as file:
+        reader = csv.reader(file)
+        next(reader)  # Header
+        for row in reader:
+            image_urls[row[0]] = [url for url in row[1:] if url]
+
+    manifest = RunManifest(os.path.join(output_folder, 'download_manifest.sqlite'))
+    try:
+        run_pipeline(
+            list(image_urls),
+            scrape=image_urls.get,
+            download=lambda part_number, index, url: scraper.download_part_image(part_number, index, url, manifest),
+            on_image_failed=lambda part_number, index, url, reason: scraper.record_failed_image(
+                manifest, part_number, url, scraper.part_image_path(part_number, index), reason),
+            on_part_done=lambda part_number, num_images: None,
+        )
+    finally:
+        manifest.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import argparse
+import asyncio
+import os
+import threading
+
+from aiohttp import web
+
+# Fixture pages served by the stand-in site
+PAGES_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'supersprint_pages')
+
+# Product page served for each product slug: one with the image carousel, one without it
+# (its images are loaded by script, so only the browser fallback can find them)
+PRODUCT_PAGES = {
+    'ss-1001': 'product.html',
+    'ss-2002': 'product.html',
+    'ss-3003': 'no_carousel.html',
+}
+
+# Part numbers whose search redirects straight to the product page instead of listing results
+DIRECT_HITS = {'SS-2002': '/en-us/products/ss-2002.aspx'}
+
+# Stand-in for the Supersprint site: the search page, product pages and images, served from the
+# fixture pages in supersprint_pages/. Any other part number gets a results page without a link
+# to it. /stats reports the requests per path.
+class StandInSite:
+    def __init__(self):
+        self.pages = {}
+        for filename in os.listdir(PAGES_FOLDER):
+            with open(os.path.join(PAGES_FOLDER, filename), encoding='utf-8') as file:
+                self.pages[filename] = file.read()
+        self.requests = {}
+
+    def _count(self, request):
+        self.requests[request.path] = self.requests.get(request.path, 0) + 1
+
+    async def search(self, request):
+        self._count(request)
+        part_number = request.query.get('q', '').strip().upper()
+        if part_number in DIRECT_HITS:
+            raise web.HTTPFound(DIRECT_HITS[part_number])
+        return web.Response(text=self.pages['search_results.html'], content_type='text/html')
+
+    async def product(self, request):
+        self._count(request)
+        page = PRODUCT_PAGES.get(request.match_info['slug'])
+        if page is None:
+            raise web.HTTPNotFound()
+        return web.Response(text=self.pages[page], content_type='text/html')
+
+    async def image(self, request):
+        self._count(request)
+        return web.Response(body=b'\xff\xd8\xff\xe0' + bytes(range(256)) * 16, content_type='image/jpeg')
+
+    async def stats(self, request):
+        return web.json_response({'requests': self.requests})
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get('/en-us/search.aspx', self.search)
+        app.router.add_get('/en-us/products/{slug}.aspx', self.product)
+        app.router.add_get('/img/{name}', self.image)
+        app.router.add_get('/stats', self.stats)
+        return app
+
+# Function to serve the site from a background thread, for checks that read its counters directly
+def serve_in_thread(site, port):
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(site.app())
+    loop.run_until_complete(runner.setup())
+    loop.run_until_complete(web.TCPSite(runner, '127.0.0.1', port).start())
+    threading.Thread(target=loop.run_forever, name='stand-in-site', daemon=True).start()
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in Supersprint site serving fixture pages")
+    parser.add_argument('--port', type=int, default=8810)
+    args = parser.parse_args()
+    print(f"Serving on http://127.0.0.1:{args.port}; set SUPERSPRINT_BASE_URL to it to point the scrapers here")
+    web.run_app(StandInSite().app(), host='127.0.0.1', port=args.port, print=None)
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,12 @@
+import argparse
+import hashlib
 import os
+import sys
+import threading
 import time
+from functools import partial
 import requests
 import csv
-import concurrent.futures
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
@@ -10,7 +14,27 @@ from selenium.webdriver.edge.service import Service
 from selenium.webdriver.edge.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from bs4 import BeautifulSoup
+from selenium.common.exceptions import TimeoutException
+from driver_pool import DriverPool
+from retry_scheduler import RETRYABLE_STATUSES, RetryingExecutor, RetryLater, host_of, parse_retry_after
+from run_metrics import ProgressReporter, RunMetrics
+from scrape_pipeline import run_pipeline
+from sharding import add_shard_arguments, append_shard_files, in_shard, launch_shards, merge_shards, open_manifest, print_shard_report, shard_path
+from supersprint_http import BASE_URL, absolute_url, parse_product_image_urls, resolve_product_image_urls
+
+IMAGES_FOLDER = 'Supersprint_images'
+
+# ✅ Modified: one live progress line (parts, rate, ETA) instead of a line per image
+metrics = RunMetrics()
+progress = ProgressReporter(metrics, label='parts')
+processed_lock = threading.Lock()
+
+# ✅ Modified: a sharded worker appends to its own copy of the processed list
+PROCESSED_FILE = 'processed_part_numbers.csv'
+processed_file = PROCESSED_FILE
+
+# ✅ Modified: parts already listed (loaded on the first write) are not appended again by --redownload
+processed_parts = None
 
 # Function to initialize Edge WebDriver
 def init_driver():
@@ -22,29 +46,30 @@ def init_driver():
 
 # Function to scrape multiple product images from the swiper-container (carousel)
 def scrape_multiple_product_images(driver):
-    soup = BeautifulSoup(driver.page_source, 'html.parser')
-    swiper_slide_tags = soup.find_all('div', {'class': 'swiper-slide'})
-    image_urls = []
-    for swiper_slide in swiper_slide_tags:
-        img_tag = swiper_slide.find('img', {'class': 'system-components-pack-item-image'})
-        if img_tag and img_tag.get('src'):
-            image_urls.append(img_tag['src'])
-    return image_urls
+    return parse_product_image_urls(driver.page_source)
 
-# Function to scrape product images for a given part number
-def scrape_product_images(part_number):
-    driver = init_driver()
-    driver.get("https://www.supersprint.com/en-us/default.aspx")
+# Load the home page and dismiss the popup (runs once per pooled driver)
+def open_home_page(driver):
+    driver.get(BASE_URL + "/en-us/default.aspx")
 
     try:
         popup = WebDriverWait(driver, 5).until(
             EC.presence_of_element_located((By.ID, "ctl00_ContentPlaceHolder13_ctl01_mainWrap"))
         )
         driver.execute_script("document.getElementById('ctl00_ContentPlaceHolder13_ctl01_mainWrap').style.display = 'none';")
-        print(f"Popup closed for {part_number} via JavaScript")
+        progress.log("Popup closed via JavaScript")
     except Exception as e:
-        print(f"No popup found or already closed for {part_number}.", e)
+        progress.log(f"No popup found or already closed. {e}")
+
+# Launch a browser that is ready to search (used by the driver pool)
+def create_ready_driver():
+    driver = init_driver()
+    open_home_page(driver)
+    return driver
 
+# Run the site search for a part number from whatever page the driver is on
+# ✅ Modified: returns the page it was on, to tell when the results have replaced it
+def search_part_number(driver, part_number):
     search_icon = WebDriverWait(driver, 10).until(
         EC.element_to_be_clickable((By.XPATH, "//a[@class='search-icon-container']"))
     )
@@ -54,103 +79,261 @@ def scrape_product_images(part_number):
         EC.presence_of_element_located((By.XPATH, "//input[@class='input-search-box']"))
     )
     search_box.clear()
+    current_page = driver.find_element(By.TAG_NAME, 'html')
     search_box.send_keys(part_number)
     search_box.send_keys(Keys.RETURN)
+    return current_page
 
-    WebDriverWait(driver, 20).until(
-        EC.presence_of_element_located((By.CLASS_NAME, "swiper-container"))
-    )
+# ✅ Modified: a page without the swiper container (unknown part, no images) returns False
+# instead of raising, so the pooled driver is not thrown away for it
+def wait_for_product_page(driver, previous_page):
+    WebDriverWait(driver, 20).until(EC.staleness_of(previous_page))
+    try:
+        WebDriverWait(driver, 20).until(
+            EC.presence_of_element_located((By.CLASS_NAME, "swiper-container"))
+        )
+        return True
+    except TimeoutException:
+        return False
 
-    image_urls = scrape_multiple_product_images(driver)
-    driver.quit()
-    return image_urls
+# ✅ Modified: Reuses a warm pooled driver instead of launching a browser per part
+# ✅ Modified: only an unreachable search box reloads the home page; a missing carousel returns []
+def scrape_product_images(driver, part_number):
+    try:
+        previous_page = search_part_number(driver, part_number)
+    except TimeoutException:
+        progress.log(f"Search not reachable for {part_number}, reloading the home page")
+        open_home_page(driver)
+        previous_page = search_part_number(driver, part_number)
+
+    if not wait_for_product_page(driver, previous_page):
+        progress.log(f"No image carousel found for {part_number}")
+        return []
+    return scrape_multiple_product_images(driver)
+
+# ✅ Modified: one attempt per call; transient failures raise RetryLater and are retried
+# from the retry scheduler's delay queue instead of sleeping in this thread
+def safe_download(url):
+    started = time.perf_counter()
+    try:
+        response = requests.get(url, timeout=10)
+    except Exception as e:
+        metrics.record_request(host_of(url), 'error')
+        raise RetryLater(f"Request Error: {e}")
+    metrics.record_response(host_of(url), response, started)
+    if response.status_code == 200 and 'image' in response.headers.get('Content-Type', ''):
+        return response
+    if response.status_code not in RETRYABLE_STATUSES:
+        progress.log(f"Invalid response for {url} (HTTP {response.status_code})")
+    if response.status_code == 200 or response.status_code in RETRYABLE_STATUSES:
+        raise RetryLater(f"Invalid response: HTTP {response.status_code}",
+                         parse_retry_after(response.headers.get('Retry-After')))
+    return None
+
+# Download one image and record it in the manifest
+def save_image(part_number, url, image_path, manifest):
+    response = safe_download(url)
+    if not response:
+        return False
+    # ✅ Modified: Written under a temporary name and renamed, so an interrupted run never leaves half an image
+    with open(image_path + '.part', 'wb') as file:
+        file.write(response.content)
+    os.replace(image_path + '.part', image_path)
+    manifest.record(part_number, url, image_path, 'downloaded',
+                    len(response.content), hashlib.sha256(response.content).hexdigest())
+    return True
+
+def part_image_path(part_number, index):
+    return os.path.join(IMAGES_FOLDER, f"{part_number}_{index}.jpg")
 
-# ✅ Modified: Download with retry logic
-def download_images(image_urls, part_number):
-    folder_path = 'Supersprint_images'
-    if not os.path.exists(folder_path):
-        os.makedirs(folder_path)
-
-    def safe_download(url, retries=3, delay=2):
-        for attempt in range(retries):
-            try:
-                response = requests.get(url, timeout=10)
-                if response.status_code == 200 and 'image' in response.headers.get('Content-Type', ''):
-                    return response
-                else:
-                    print(f"Invalid response on attempt {attempt + 1} for {url}")
-            except Exception as e:
-                print(f"Error on attempt {attempt + 1} for {url}: {e}")
-            time.sleep(delay)
-        print(f"Failed to download after {retries} attempts: {url}")
-        return None
-
-    downloaded_count = 0
-    for index, url in enumerate(image_urls, start=1):
-        if url.startswith('/'):
-            url = 'https://www.supersprint.com' + url
-
-        response = safe_download(url)
-        if response:
-            image_name = f"{part_number}_{index}.jpg"
-            image_path = os.path.join(folder_path, image_name)
-            with open(image_path, 'wb') as file:
-                file.write(response.content)
-            print(f"Downloaded {image_name}")
-            downloaded_count += 1
-
-    return downloaded_count
+# Download one of a part's images into a file named with part_number and index
+def download_part_image(part_number, index, url, manifest):
+    # Skip images that an earlier run already downloaded and that are still on disk
+    image_path = part_image_path(part_number, index)
+    if manifest.is_done(part_number, url) and os.path.exists(image_path):
+        return True
+    return save_image(part_number, url, image_path, manifest)
+
+# Record an image the download stage gave up on
+def record_failed_image(manifest, part_number, url, image_path, reason):
+    manifest.record(part_number, url, image_path, 'failed')
+    progress.log(f"Giving up on {url}: {reason}")
 
 # Read processed part numbers
-def read_processed_part_numbers():
-    if os.path.exists('processed_part_numbers.csv'):
-        with open('processed_part_numbers.csv', 'r', newline='') as f:
+def read_processed_part_numbers(path=PROCESSED_FILE):
+    if os.path.exists(path):
+        with open(path, 'r', newline='') as f:
             reader = csv.DictReader(f)
             return {row['part_number']: int(row['number_of_images']) for row in reader}
     return {}
 
 # Write processed part numbers
 def write_processed_part_number(part_number, num_images):
-    file_exists = os.path.exists('processed_part_numbers.csv')
-    with open('processed_part_numbers.csv', 'a', newline='') as f:
-        fieldnames = ['part_number', 'number_of_images']
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        if not file_exists:
-            writer.writeheader()
-        writer.writerow({'part_number': part_number, 'number_of_images': num_images})
+    global processed_parts
+    with processed_lock:
+        if processed_parts is None:
+            processed_parts = {*read_processed_part_numbers(), *read_processed_part_numbers(processed_file)}
+        if part_number in processed_parts:
+            return
+        processed_parts.add(part_number)
+        file_exists = os.path.exists(processed_file)
+        with open(processed_file, 'a', newline='') as f:
+            fieldnames = ['part_number', 'number_of_images']
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            if not file_exists:
+                writer.writeheader()
+            writer.writerow({'part_number': part_number, 'number_of_images': num_images})
 
 # ✅ Modified: Added logging for skipped part numbers
-def process_part_numbers_from_csv(csv_file):
-    processed_part_numbers = read_processed_part_numbers()
+# ✅ Modified: with a shard, only its part numbers are returned
+# ✅ Modified: include_processed returns already processed part numbers too (--redownload)
+def process_part_numbers_from_csv(csv_file, shard=None, include_processed=False):
+    processed_part_numbers = {} if include_processed else read_processed_part_numbers()
+    if shard is not None and not include_processed:
+        processed_part_numbers.update(read_processed_part_numbers(shard_path(PROCESSED_FILE, shard)))
     with open(csv_file, mode='r') as file:
         reader = csv.DictReader(file)
         part_numbers_to_process = []
         for row in reader:
             part_number = row['part_number'].strip()
+            if not in_shard(part_number, shard):
+                continue
             if part_number not in processed_part_numbers:
                 part_numbers_to_process.append(part_number)
             else:
                 print(f"Skipping already processed: {part_number}")
     return part_numbers_to_process
 
-# Process single part number
-def process_single_part_number(part_number):
-    print(f"Processing part number: {part_number}")
-    image_urls = scrape_product_images(part_number)
-    if image_urls:
-        num_images = download_images(image_urls, part_number)
-        write_processed_part_number(part_number, num_images)
-    else:
-        print(f"No images found for {part_number}")
+# ✅ Modified: scrape stage only resolves URLs; downloads run in their own pool
+def scrape_part_number(part_number, driver_pool):
+    # ✅ Modified: plain HTTP first, browser only when the page structure isn't found
+    image_urls = resolve_product_image_urls(part_number, log=progress.log)
+    if image_urls is None:
+        progress.log(f"Falling back to the browser for {part_number}")
+        with driver_pool.driver() as driver:
+            image_urls = scrape_product_images(driver, part_number)
+    return [absolute_url(url) for url in image_urls or []]
+
+# ✅ Modified: parts that finish without any download still count towards the progress line
+# ✅ Modified: URLs scraped less than max_age seconds ago come from the manifest's scrape cache
+def scrape_and_count(part_number, driver_pool, manifest, max_age=None):
+    image_urls = manifest.cached_part_urls(part_number, max_age)
+    if image_urls is None:
+        try:
+            image_urls = scrape_part_number(part_number, driver_pool)
+        except Exception:
+            metrics.finished('failed')
+            raise
+        if image_urls:
+            manifest.record_part_urls(part_number, image_urls)
+    if not image_urls:
+        metrics.finished('no_images')
+    return image_urls
+
+# Mark a part processed once all of its images are on disk
+def finish_part(part_number, num_images):
+    write_processed_part_number(part_number, num_images)
+    metrics.finished('done')
+
+# ✅ Modified: a part with images that were given up on stays unprocessed; the next run re-drives it
+# from the scrape cache and only fetches the missing images
+def leave_part_unprocessed(part_number, num_images):
+    metrics.finished('failed')
+    progress.log(f"Only {num_images} image(s) of {part_number} downloaded; it will be retried on the next run")
+
+# Re-download only the images whose last attempt failed (no browser needed)
+def retry_failed_downloads(manifest):
+    failed_rows = manifest.failed_rows()
+    if not failed_rows:
+        print("No failed downloads to retry.")
+        return
+    def image_done(part_number, url, image_path, ok, reason):
+        metrics.finished('downloaded' if ok else 'failed')
+        if not ok:
+            record_failed_image(manifest, part_number, url, image_path, reason)
+
+    progress.label = 'images'
+    metrics.set_total(len(failed_rows))
+    progress.start()
+    executor = RetryingExecutor(max_workers=32, log=progress.log)  # Thread cap; per-host concurrency adapts below it
+    try:
+        for part_number, url, image_path in failed_rows:
+            executor.submit(
+                partial(save_image, part_number, url, image_path, manifest),
+                host_of(url),
+                partial(image_done, part_number, url, image_path),
+            )
+        executor.shutdown()
+    finally:
+        progress.close()
 
 # Main function
 def main():
-    part_numbers = process_part_numbers_from_csv('part_numbers.csv')
-    if part_numbers:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-            executor.map(process_single_part_number, part_numbers)
-    else:
-        print("No unprocessed part numbers found.")
+    parser = argparse.ArgumentParser(description="Scrape and download Supersprint product images")
+    parser.add_argument('--retry-failed', action='store_true',
+                        help="Only re-download the images whose last attempt failed")
+    parser.add_argument('--metrics', help="Write a metrics snapshot (per-host request timings) here; *.prom for Prometheus, else JSON")
+    parser.add_argument('--metrics-interval', type=float, help="Also rewrite the --metrics file every this many seconds")
+    parser.add_argument('--redownload', action='store_true',
+                        help="Also re-run processed part numbers: images missing from disk are downloaded again, "
+                             "from cached URLs where possible")
+    parser.add_argument('--cache-ttl', type=float, default=30,
+                        help="Days a part's scraped image URLs are reused before it is scraped again (0: always scrape)")
+    add_shard_arguments(parser)
+    args = parser.parse_args()
+    max_age = args.cache_ttl * 86400
+
+    if not os.path.exists(IMAGES_FOLDER):
+        os.makedirs(IMAGES_FOLDER)
+    manifest_file = os.path.join(IMAGES_FOLDER, 'download_manifest.sqlite')
+
+    # ✅ Modified: --shards N runs one worker process per shard (each with its own browsers) and merges
+    # their results; --merge-shards N merges shards that ran on other machines with --shard I/N
+    if args.merge_shards or (args.shards and args.shard is None):
+        shard_count = args.merge_shards or args.shards
+        exit_codes = [] if args.merge_shards else launch_shards(shard_count, IMAGES_FOLDER)
+        append_shard_files(PROCESSED_FILE, shard_count, header_lines=1)
+        report_file = os.path.join(IMAGES_FOLDER, 'shard_report.json')
+        print_shard_report(merge_shards(manifest_file, shard_count, report_file), report_file)
+        sys.exit(1 if any(exit_codes) else 0)
+
+    global processed_file
+    processed_file = shard_path(PROCESSED_FILE, args.shard)
+    manifest = open_manifest(manifest_file, args.shard)
+    progress.export_path = shard_path(args.metrics, args.shard) if args.metrics else None
+    progress.export_interval = args.metrics_interval
+
+    try:
+        if args.retry_failed:
+            retry_failed_downloads(manifest)
+        else:
+            part_numbers = process_part_numbers_from_csv('part_numbers.csv', args.shard, args.redownload)
+            if part_numbers:
+                metrics.set_total(len(part_numbers))
+                progress.start()
+                scrape_workers = 10
+                download_workers = 32
+                driver_pool = DriverPool(create_ready_driver, size=scrape_workers, max_uses=100)
+                try:
+                    run_pipeline(
+                        part_numbers,
+                        scrape=lambda part_number: scrape_and_count(part_number, driver_pool, manifest, max_age),
+                        download=lambda part_number, index, url: download_part_image(part_number, index, url, manifest),
+                        on_image_failed=lambda part_number, index, url, reason: record_failed_image(
+                            manifest, part_number, url, part_image_path(part_number, index), reason),
+                        on_part_done=finish_part,
+                        on_part_incomplete=leave_part_unprocessed,
+                        scrape_workers=scrape_workers,
+                        download_workers=download_workers,
+                        log=progress.log,
+                    )
+                finally:
+                    driver_pool.close()
+                    progress.close()
+            else:
+                print("No unprocessed part numbers found.")
+    finally:
+        manifest.close()
     print("Download process completed.")
 
 # Run the main function
@@ -0,0 +1,53 @@
+import hashlib
+import os
+import shutil
+import uuid
+
+# Content-addressed store: every distinct image is kept once under its SHA-256,
+# and the per-part filenames are materialized as links to it.
+class BlobStore:
+    # tmp_folder defaults to <root>/tmp; processes sharing one store need one each
+    def __init__(self, root, tmp_folder=None):
+        self.root = root
+        self.tmp_folder = tmp_folder or os.path.join(root, 'tmp')
+        os.makedirs(self.tmp_folder, exist_ok=True)
+
+    # Function to get a fresh temp path to stream a download into before its hash is known
+    def temp_path(self):
+        return os.path.join(self.tmp_folder, uuid.uuid4().hex)
+
+    # Function to get the stable temp path of a URL's download, so an interrupted transfer can be resumed
+    def partial_path(self, url):
+        return os.path.join(self.tmp_folder, hashlib.sha256(url.encode('utf-8')).hexdigest() + '.part')
+
+    # Function to get the final location of a blob (fanned out by hash prefix)
+    def blob_path(self, sha256):
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    # Function to move a finished download into the store; byte-identical images collapse to one blob
+    def commit(self, temp_path, sha256):
+        blob_path = self.blob_path(sha256)
+        if os.path.exists(blob_path):
+            os.remove(temp_path)
+        else:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.replace(temp_path, blob_path)
+        return blob_path
+
+# Function to make target point at the same bytes as source: hardlink, then symlink, then a plain copy
+def materialize(source, target):
+    if os.path.abspath(source) == os.path.abspath(target):
+        return
+    if os.path.lexists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+        return
+    except OSError:
+        pass
+    try:
+        os.symlink(os.path.abspath(source), target)
+        return
+    except OSError:
+        pass
+    shutil.copyfile(source, target)
@@ -0,0 +1,38 @@
+import csv
+
+# Streaming readers built on the csv module: one row in memory at a time, and no pandas import
+# (which alone costs about half a second of startup on every run).
+# Every cell is a string; empty cells come back as None.
+
+# Function to open a sheet for reading (utf-8-sig also accepts the BOM Excel puts in front)
+def _open_sheet(file_path):
+    return open(file_path, 'r', encoding='utf-8-sig', newline='')
+
+def _cell(value):
+    return value if value else None
+
+# Function to yield (part_number, image_url, column_index) for every non-empty image cell
+# of a wide sheet (part_number | image_url | image_url_1 | ...)
+def iter_wide_cells(file_path):
+    with _open_sheet(file_path) as file:
+        reader = csv.reader(file)
+        header = next(reader, None)
+        if header is None:
+            return
+        part_column = header.index('part_number')
+        for row in reader:
+            if not row:
+                continue  # Blank line
+            part_number = _cell(row[part_column]) if part_column < len(row) else None
+            # Every column after the first holds an image URL; column_index counts from there
+            for column, image_url in enumerate(row[1:len(header)]):
+                if image_url:
+                    yield part_number, image_url, column
+
+# Function to yield (part_number, image_url) for every row of a long sheet (part_number | image_url)
+# Empty rows are still yielded because they count towards the per-part image numbering
+def iter_long_rows(file_path):
+    with _open_sheet(file_path) as file:
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield _cell(row['part_number']), _cell(row['image_url'])
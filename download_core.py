@@ -0,0 +1,226 @@
+import argparse
+import itertools
+import os
+import re
+import sys
+import threading
+
+from blob_store import BlobStore
+from download_tasks import DownloadTask
+from run_journal import RunJournal
+from run_metrics import ProgressReporter, RunMetrics
+from sharding import add_shard_arguments, in_shard, launch_shards, merge_shards, open_manifest, print_shard_report, shard_name, shard_path
+
+# Shared core of the CSV download scripts (download-multi-images.py, download-by-column.py).
+# A script only says where its sheet and folder are and how a sheet turns into
+# (part_number, image_url, filename) triples; everything else lives here.
+# Heavy modules (aiohttp, OpenCV) are imported only once there is something to download or process,
+# so a run over an already finished sheet starts and ends in a fraction of a second.
+
+# Function to build the command line shared by the download scripts
+def build_parser():
+    parser = argparse.ArgumentParser(description="Download product images listed in a CSV sheet")
+    parser.add_argument('--csv', help="Sheet to read (default: file_path in the script)")
+    parser.add_argument('--save-folder', help="Folder to save the images in (default: save_folder in the script)")
+    parser.add_argument('--retry-failed', action='store_true',
+                        help="Only re-run the images whose last attempt failed (read from the run manifest)")
+    parser.add_argument('--revalidate', action='store_true',
+                        help="Re-check already downloaded images with conditional requests instead of skipping them")
+    parser.add_argument('--blob-store', action='store_true',
+                        help="Keep each distinct image once under its SHA-256 and hardlink the per-part filenames to it")
+    parser.add_argument('--metrics', help="Write a metrics snapshot (per-host request timings) here; *.prom for Prometheus, else JSON")
+    parser.add_argument('--metrics-interval', type=float, help="Also rewrite the --metrics file every this many seconds")
+    parser.add_argument('--verbose', action='store_true', help="Print every image instead of only failures")
+    parser.add_argument('--process', action='store_true',
+                        help="Decode every image in memory before writing it, rejecting corrupt files and fixing the extension")
+    parser.add_argument('--remove-watermark', action='store_true', help="Inpaint detected watermarks (implies --process)")
+    parser.add_argument('--max-edge', type=int, help="Shrink images so the longest edge is at most this many pixels (implies --process)")
+    parser.add_argument('--format', choices=['jpg', 'png', 'webp'], help="Re-encode every image to this format (implies --process)")
+    parser.add_argument('--quality', type=int, default=90, help="JPEG/WebP quality used when re-encoding")
+    parser.add_argument('--cpu-workers', type=int, help="Processes for the processing stage (default: one per core)")
+    add_shard_arguments(parser)
+    return parser
+
+# Function to sanitize file names
+def sanitize_filename(filename):
+    return re.sub(r'[<>:"/\\|?*]', '_', filename)
+
+# One run of a download script over one sheet: journal, manifest, progress line and the
+# task stream fed to the download engine.
+#   iter_sheet_images(file_path) -> (part_number, image_url, filename) for every image in the sheet
+class SheetDownload:
+    def __init__(self, args, file_path, save_folder, iter_sheet_images):
+        self.args = args
+        self.file_path = file_path
+        self.save_folder = save_folder
+        self.iter_sheet_images = iter_sheet_images
+
+        # Journal of every download outcome (downloaded, skipped, failed), one JSON record per line.
+        # Filter it on "status": "failed" to get the failed downloads. A shard writes its own.
+        self.journal = RunJournal(shard_path(os.path.join(save_folder, "download_journal.jsonl"), args.shard))
+
+        # Indexed manifest of every image (status, size, hash, attempts) used to resume and retry runs
+        self.manifest = open_manifest(os.path.join(save_folder, "download_manifest.sqlite"), args.shard)
+
+        # One live progress line instead of a line per image
+        self.metrics = RunMetrics()
+        metrics_file = shard_path(args.metrics, args.shard) if args.metrics else None
+        self.progress = ProgressReporter(self.metrics, export_path=metrics_file, export_interval=args.metrics_interval)
+
+    # Function to log a failed download entry (queued for the journal's writer thread)
+    def log_failed_download(self, part_number, image_url, reason):
+        self.journal.record(part_number, image_url, 'failed', reason)
+        self.metrics.finished('failed')
+        self.progress.log(f"Failed to download {image_url} ({part_number}): {reason}")
+
+    # Function to turn one sheet cell into a download task (or a message explaining why it was skipped)
+    def build_download_task(self, part_number, image_url, filename):
+        if not part_number:
+            self.metrics.finished('skipped')
+            return None, f"Skipping image without a part number: {image_url}"
+        if not image_url or not image_url.strip():
+            self.metrics.finished('skipped')
+            return None, f"Skipping empty URL for {part_number}"
+
+        image_url = image_url.strip()
+
+        # Ensure the URL has a valid scheme
+        if not image_url.startswith('http'):
+            self.log_failed_download(part_number, image_url, "Invalid URL")
+            return None, f"Invalid URL for {part_number}: {image_url}"
+
+        image_path = os.path.join(self.save_folder, filename)
+
+        # Skip if the image was already downloaded in an earlier run (one index lookup, no stat)
+        if self.manifest.is_done(part_number, image_url) and not self.args.revalidate:
+            self.journal.record(part_number, image_url, 'skipped', "Already downloaded", path=image_path)
+            self.metrics.finished('skipped')
+            return None, f"Image {image_path} already exists. Skipping."
+
+        # Send a conditional request when we already hold this image (possibly under an older ?v=)
+        cached = self.manifest.cached_entry(image_url)
+        if cached and cached.path == image_path and os.path.exists(image_path):
+            return DownloadTask(part_number, image_url, image_path, cached.etag, cached.last_modified), None
+
+        return DownloadTask(part_number, image_url, image_path), None
+
+    # Function to report a finished download and log it if it failed
+    def handle_result(self, result):
+        task = result.task
+        if result.not_modified:
+            self.manifest.record_not_modified(task.part_number, task.image_url, task.image_path)
+            self.journal.record(task.part_number, task.image_url, 'not_modified', path=task.image_path)
+            self.metrics.finished('not_modified')
+            if self.args.verbose:
+                self.progress.log(f"Not modified: {task.image_path}")
+            return
+
+        self.manifest.record(task.part_number, task.image_url, task.image_path,
+                             'downloaded' if result.reason is None else 'failed', result.size, result.sha256)
+        if result.reason is None:
+            # The validators belong to the file that was actually fetched; a duplicate only links to
+            # it, and pointing the cache at the duplicate would stop the next run's conditional request
+            if not result.duplicate:
+                self.manifest.record_validators(task.image_url, task.image_path,
+                                                result.etag, result.last_modified, result.size, result.sha256)
+            self.journal.record(task.part_number, task.image_url, 'downloaded', path=task.image_path, bytes=result.size)
+            self.metrics.finished('downloaded')
+            if self.args.verbose:
+                self.progress.log(f"Downloaded: {task.image_path}")
+        else:
+            self.log_failed_download(task.part_number, task.image_url, result.reason)
+
+    # Function to yield a task for every image of the sheet (of this shard), streaming the sheet
+    def iter_download_tasks(self):
+        for part_number, image_url, filename in self.iter_sheet_images(self.file_path):
+            if not in_shard(part_number, self.args.shard):
+                continue
+            task, message = self.build_download_task(part_number, image_url, filename)
+            if task is None:
+                if self.args.verbose:
+                    self.progress.log(message)
+            else:
+                yield task
+
+    # Function to count the images of the sheet (the run's total, for the progress ETA)
+    def count_tasks(self):
+        self.metrics.set_total(sum(1 for part_number, _, _ in self.iter_sheet_images(self.file_path)
+                                   if in_shard(part_number, self.args.shard)))
+
+    # Function to yield a task for every image that failed in an earlier run
+    def iter_failed_tasks(self):
+        failed_rows = self.manifest.failed_rows()
+        self.metrics.set_total(len(failed_rows))
+        for part_number, image_url, image_path in failed_rows:
+            yield DownloadTask(part_number, image_url, image_path)
+
+    # Function to download everything through the shared asyncio engine (pooled keep-alive
+    # connections per host). Repeated URLs are fetched once and linked to every filename that lists them.
+    def run(self, max_connections, per_host_connections):
+        args = self.args
+
+        # Optional content-addressed store: byte-identical images are kept on disk only once
+        blob_store = None
+        if args.blob_store:
+            blob_folder = os.path.join(self.save_folder, "_blobs")
+            tmp_folder = os.path.join(blob_folder, "tmp", shard_name(args.shard)) if args.shard else None
+            blob_store = BlobStore(blob_folder, tmp_folder)
+
+        # Optional post-download stage: decode from memory, process on a CPU pool, write once
+        process_options = None
+        if args.process or args.remove_watermark or args.max_edge or args.format:
+            from image_processing import ProcessOptions  # Needs OpenCV; only imported when asked for
+            process_options = ProcessOptions(args.remove_watermark, args.max_edge, args.format, args.quality)
+
+        # The expected total (for the ETA) is counted from the sheet in the background while the
+        # downloads already run
+        self.progress.start()
+        if not args.retry_failed:
+            threading.Thread(target=self.count_tasks, daemon=True).start()
+
+        try:
+            tasks = self.iter_failed_tasks() if args.retry_failed else self.iter_download_tasks()
+            # Only start the engine (and import aiohttp) once there is at least one image to fetch
+            first_task = next(tasks, None)
+            if first_task is not None:
+                from download_engine import run_downloads
+                run_downloads(
+                    itertools.chain([first_task], tasks),
+                    self.handle_result,
+                    max_connections=max_connections,
+                    per_host_connections=per_host_connections,
+                    blob_store=blob_store,
+                    process_options=process_options,
+                    cpu_workers=args.cpu_workers,
+                    metrics=self.metrics,
+                    log=self.progress.log,
+                )
+        finally:
+            self.progress.close()
+            self.manifest.close()
+            self.journal.close()  # Flush the remaining journal records
+
+# Function to run a download script: parse the command line, then either run (a shard of) the
+# sheet in this process, or start and merge one worker process per shard
+def main(iter_sheet_images, file_path, save_folder, max_connections, per_host_connections):
+    args = build_parser().parse_args()
+    file_path = args.csv or file_path
+    save_folder = args.save_folder or save_folder
+
+    # Create the folder if it doesn't exist
+    if not os.path.exists(save_folder):
+        os.makedirs(save_folder)
+
+    # Sharded run: --shards N starts one worker process per shard here and merges their results;
+    # --merge-shards N merges shards that ran elsewhere (e.g. --shard I/N on other machines)
+    if args.merge_shards or (args.shards and args.shard is None):
+        shard_count = args.merge_shards or args.shards
+        exit_codes = [] if args.merge_shards else launch_shards(shard_count, save_folder)
+        report_file = os.path.join(save_folder, "shard_report.json")
+        report = merge_shards(os.path.join(save_folder, "download_manifest.sqlite"), shard_count, report_file,
+                              os.path.join(save_folder, "download_journal.jsonl"))
+        print_shard_report(report, report_file)
+        sys.exit(1 if any(exit_codes) else 0)
+
+    SheetDownload(args, file_path, save_folder, iter_sheet_images).run(max_connections, per_host_connections)
+    print("Download process completed.")
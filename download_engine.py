@@ -0,0 +1,472 @@
+import asyncio
+import hashlib
+import itertools
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import aiohttp
+
+from adaptive_concurrency import AdaptiveConcurrency
+from blob_store import materialize
+from download_tasks import DownloadResult
+from image_formats import SNIFF_SIZE, sniff_format
+from retry_scheduler import RETRYABLE_STATUSES, CircuitBreaker, RetryPolicy, host_of, parse_retry_after
+
+CHUNK_SIZE = 64 * 1024
+
+# Tasks pulled from the producer per hop into the work queue
+FEED_BATCH_SIZE = 500
+
+# Function to read the first bytes of a body (fewer when the body is shorter)
+async def read_head(content):
+    try:
+        return await content.readexactly(SNIFF_SIZE)
+    except asyncio.IncompleteReadError as e:
+        return e.partial
+
+# Suffix of a download in progress; the final name only ever holds complete files
+PARTIAL_SUFFIX = '.part'
+
+# Sidecar holding the ETag / Last-Modified a partial file was fetched under (for If-Range)
+VALIDATOR_SUFFIX = '.part.validator'
+
+# Bodies at least this large keep their partial file across interruptions and resume with a
+# Range request; smaller ones simply start over
+RESUME_MIN_BYTES = 1024 * 1024
+
+# Function to get where a task's body is written until it is complete
+def partial_path_for(task, blob_store=None):
+    return blob_store.partial_path(task.image_url) if blob_store else task.image_path + PARTIAL_SUFFIX
+
+# Function to get (offset, validator) to resume a partial download from, or (0, None)
+def resume_point(partial_path):
+    try:
+        with open(partial_path + VALIDATOR_SUFFIX, encoding='utf-8') as file:
+            validator = file.read().strip()
+        return os.path.getsize(partial_path), validator
+    except OSError:
+        return 0, None
+
+# Function to remove a partial download and its validator sidecar
+def discard_partial(partial_path):
+    for path in (partial_path, partial_path + VALIDATOR_SUFFIX):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+# Function to get the validator a resumed request may use in If-Range (strong ETag, else Last-Modified)
+def range_validator(etag, last_modified):
+    if etag and not etag.startswith('W/'):
+        return etag
+    return last_modified
+
+# Function to read (first byte, total length) from a Content-Range header like "bytes 100-999/1000"
+def parse_content_range(value):
+    try:
+        first, _, rest = value.partition(' ')[2].partition('-')
+        total = rest.partition('/')[2]
+        return int(first), int(total) if total != '*' else None
+    except (AttributeError, ValueError):
+        return None, None
+
+# Function to stream a single image to disk over a pooled keep-alive connection.
+# The body goes to a .part file that is renamed into place only once its length matches the
+# response's Content-Length, so an interrupted transfer never leaves a truncated image under the
+# final name. Large partial files survive interruptions and are resumed with a Range request
+# (guarded by If-Range, so a changed image restarts from scratch).
+# With a blob store the body is committed under its hash instead and then linked to image_path.
+# With process (an async callable taking the body and a target path without extension) the body is
+# kept in memory and handed over whole; it writes the final file once and returns
+# (extension, size, sha256). The result's task then carries the path with that extension.
+# timing, when given, is passed to the session's trace configs (see run_metrics) and gets the
+# moments the response headers and the full body were received added as 'headers' and 'body_done'.
+async def download_image(session, task, blob_store=None, process=None, timing=None):
+    headers = {}
+    if task.etag:
+        headers['If-None-Match'] = task.etag
+    if task.last_modified:
+        headers['If-Modified-Since'] = task.last_modified
+
+    partial_path = None if process else partial_path_for(task, blob_store)
+    offset, validator = resume_point(partial_path) if partial_path else (0, None)
+    if offset:
+        headers['Range'] = f"bytes={offset}-"
+        headers['If-Range'] = validator
+        headers['Accept-Encoding'] = 'identity'  # Ranges count encoded bytes; keep them raw
+
+    keep_partial = False
+    try:
+        async with session.get(task.image_url, headers=headers, trace_request_ctx=timing) as response:
+            if timing is not None:
+                timing['headers'] = time.perf_counter()
+            if response.status == 416:
+                # The partial file does not fit the image any more; start over on the next attempt
+                discard_partial(partial_path)
+                return DownloadResult(task, "Range not satisfiable, restarting", 0, None, retryable=True)
+            response.raise_for_status()
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            if response.status == 304:
+                if partial_path:
+                    discard_partial(partial_path)
+                return DownloadResult(task, None, 0, None, etag or task.etag,
+                                      last_modified or task.last_modified, True)
+
+            if response.status == 206:
+                first, total = parse_content_range(response.headers.get('Content-Range'))
+                if first != offset:
+                    discard_partial(partial_path)
+                    return DownloadResult(task, "Unexpected Content-Range, restarting", 0, None, retryable=True)
+                head = b''
+            else:
+                # Full body: the server ignored the Range or the image changed since the partial
+                offset = 0
+                total = response.content_length if 'Content-Encoding' not in response.headers else None
+
+                # Check the magic bytes before anything is written, so HTML error pages and other
+                # non-image bodies served with a 200 never reach the image folder
+                head = await read_head(response.content)
+                if sniff_format(head) is None:
+                    if partial_path:
+                        discard_partial(partial_path)
+                    return DownloadResult(task, f"Not an image ({response.content_type})", 0, None)
+
+            if process:
+                body = head + await response.content.read()
+                size = len(body)
+            else:
+                digest = hashlib.sha256()
+                if offset:
+                    with open(partial_path, 'rb') as file:
+                        for block in iter(lambda: file.read(CHUNK_SIZE), b''):
+                            digest.update(block)
+                else:
+                    resumable = range_validator(etag, last_modified)
+                    if total and total >= RESUME_MIN_BYTES and resumable:
+                        with open(partial_path + VALIDATOR_SUFFIX, 'w', encoding='utf-8') as file:
+                            file.write(resumable)
+                        keep_partial = True
+                keep_partial = keep_partial or bool(offset)
+
+                size = offset + len(head)
+                digest.update(head)
+                with open(partial_path, 'ab' if offset else 'wb') as file:
+                    file.write(head)
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        file.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+                sha256 = digest.hexdigest()
+
+            if total is not None and size != total:
+                return DownloadResult(task, f"Incomplete body ({size} of {total} bytes)", 0, None,
+                                      retryable=True)
+        if timing is not None:
+            timing['body_done'] = time.perf_counter()
+
+        # The connection is back in the pool before any CPU work starts
+        if process:
+            base_path = os.path.splitext(task.image_path)[0]
+            temp_base = blob_store.temp_path() if blob_store else base_path
+            extension, size, sha256 = await process(body, temp_base)
+            task = task._replace(image_path=f"{base_path}.{extension}")
+            if blob_store:
+                materialize(blob_store.commit(f"{temp_base}.{extension}", sha256), task.image_path)
+        elif blob_store:
+            materialize(blob_store.commit(partial_path, sha256), task.image_path)
+        else:
+            os.replace(partial_path, task.image_path)
+        if partial_path and keep_partial:
+            discard_partial(partial_path)  # Only the validator sidecar is left at this point
+        return DownloadResult(task, None, size, sha256, etag, last_modified)
+    except asyncio.TimeoutError:
+        reason, retryable, retry_after = "Timeout Error", True, None
+    except aiohttp.ClientResponseError as http_err:
+        reason = f"HTTP Error: {http_err.status} {http_err.message}"
+        retryable = http_err.status in RETRYABLE_STATUSES
+        retry_after = parse_retry_after(http_err.headers.get('Retry-After')) if http_err.headers else None
+    except aiohttp.ClientError as e:
+        reason, retryable, retry_after = f"Request Error: {e}", True, None
+    except ValueError as e:
+        reason, retryable, retry_after = f"Invalid image: {e}", False, None
+    except OSError as e:
+        reason, retryable, retry_after = f"Request Error: {e}", False, None
+    finally:
+        # Small partial files are not worth resuming; never leave them behind
+        if partial_path and not keep_partial:
+            discard_partial(partial_path)
+    return DownloadResult(task, reason, 0, None, retryable=retryable, retry_after=retry_after)
+
+# Downloads one stream of tasks. Each unique URL is fetched once per run: tasks that repeat a
+# URL wait for the first fetch and then get the same bytes linked to their own image_path.
+# Transient failures are parked and re-queued after a backoff (honoring Retry-After), and a
+# per-host circuit breaker pauses a failing host while the workers keep serving the others.
+# How many requests each host gets at once adapts to its latency and errors (AIMD, see
+# adaptive_concurrency), between 1 and per_host_connections; tasks for a host at its limit (or
+# paused by the breaker) wait aside without holding a worker. At most hold_limit tasks wait aside
+# at once: past that the producer stops reading until some are handed on, so a catalog served by
+# one host is never pulled into memory ahead of its downloads.
+# With process_options (an image_processing.ProcessOptions) every body is decoded, processed and
+# written by a pool of cpu_workers processes instead of being streamed straight to disk. A worker
+# process dying breaks the whole pool: it is replaced, and the images that were in flight are each
+# processed again on their own, so only an image that kills a worker by itself fails.
+# With metrics (a run_metrics.RunMetrics) every request's connect, TTFB and transfer times are recorded.
+# log(message) reports circuit breaker trips and process pool restarts.
+class DownloadEngine:
+    def __init__(self, on_result, max_connections, per_host_connections, timeout, blob_store=None,
+                 retry_policy=None, breaker=None, process_options=None, cpu_workers=None, metrics=None,
+                 concurrency=None, log=print):
+        self.on_result = on_result
+        self.max_connections = max_connections
+        self.per_host_connections = per_host_connections
+        self.timeout = timeout
+        self.blob_store = blob_store
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker(log=log)
+        self.log = log
+        self.concurrency = concurrency or AdaptiveConcurrency(max_limit=per_host_connections)
+        self.process_options = process_options
+        self.cpu_workers = cpu_workers
+        self.cpu_pool = None
+        self._isolated = None   # lets one image at a time be reprocessed after the pool broke
+        self.metrics = metrics
+        self.queue = None
+        self.session = None
+        self._waiting = {}    # url -> tasks waiting on the fetch currently in flight
+        self._finished = {}   # url -> (image_path, reason, size, sha256, not_modified) of the completed fetch
+        self._retrying = set()  # sleeping re-queue coroutines
+        self._parked = {}       # host -> tasks waiting for that host's concurrency limit
+        self._paused = {}       # host -> tasks waiting for that host's circuit breaker to close
+        self.hold_limit = max_connections * 2
+        self._held = 0          # tasks in _parked and _paused
+        self._room = None       # set while fewer than hold_limit tasks are held
+
+    async def run(self, tasks):
+        # The connector keeps one keep-alive pool per host, so repeated requests to the
+        # same CDN reuse TCP/TLS connections instead of handshaking every time
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections,
+            limit_per_host=self.per_host_connections,
+            ttl_dns_cache=300,
+        )
+        client_timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=self.timeout)
+        self.queue = asyncio.Queue(maxsize=self.max_connections * 2)
+        self._room = asyncio.Event()
+        self._room.set()
+        self._isolated = asyncio.Lock()
+
+        if self.process_options:
+            self.cpu_pool = ProcessPoolExecutor(max_workers=self.cpu_workers)
+        try:
+            trace_configs = [self.metrics.trace_config()] if self.metrics else None
+            async with aiohttp.ClientSession(connector=connector, timeout=client_timeout,
+                                             trace_configs=trace_configs) as session:
+                self.session = session
+                workers = [asyncio.create_task(self._worker()) for _ in range(self.max_connections)]
+                await self._feed(tasks)
+                # Wait for the queue to drain and for every parked retry to come back and finish
+                while True:
+                    await self.queue.join()
+                    if not self._retrying:
+                        # Tasks still waiting on a host limit go back on the queue (normally
+                        # every release already hands them on, so this is only a safety net)
+                        stranded = [task for parked in self._parked.values()
+                                    for task in self._unhold(parked, len(parked))]
+                        if not stranded:
+                            break
+                        for task in stranded:
+                            self._retry_later(task, 0)
+                    await asyncio.wait(set(self._retrying))
+                for _ in workers:
+                    await self.queue.put(None)
+                await asyncio.gather(*workers)
+        finally:
+            if self.cpu_pool:
+                self.cpu_pool.shutdown()
+
+    # Function to run the post-download stage for one body on the CPU pool
+    async def _process(self, body, target_base):
+        from image_processing import process_image_bytes  # cv2/numpy are only needed with processing on
+        loop = asyncio.get_running_loop()
+        pool = self.cpu_pool
+        try:
+            return await loop.run_in_executor(pool, process_image_bytes, body, target_base, self.process_options)
+        except BrokenProcessPool:
+            self._replace_cpu_pool(pool)
+
+        # Every image in flight when a worker died sees the pool break, not just the one that killed
+        # it; redo this one alone in a single-worker pool, where a crash can only be its own doing
+        async with self._isolated:
+            isolated = ProcessPoolExecutor(max_workers=1)
+            try:
+                return await loop.run_in_executor(isolated, process_image_bytes, body, target_base,
+                                                  self.process_options)
+            except BrokenProcessPool:
+                raise ValueError("processing it crashed the worker process") from None
+            finally:
+                isolated.shutdown(wait=False)
+
+    # Function to swap a broken CPU pool for a fresh one (once, however many tasks saw it break)
+    def _replace_cpu_pool(self, broken):
+        if self.cpu_pool is not broken:
+            return
+        self.log("An image processing worker died; restarting the process pool")
+        self.cpu_pool = ProcessPoolExecutor(max_workers=self.cpu_workers)
+        broken.shutdown(wait=False)
+
+    # Pull tasks from the producer in a helper thread so CSV parsing never blocks the event loop.
+    # The work queue is bounded, so the producer only advances when downloaders free up a slot,
+    # and it also waits while too many tasks are held aside for busy or paused hosts.
+    async def _feed(self, tasks):
+        iterator = iter(tasks)
+        while True:
+            batch = await asyncio.to_thread(list, itertools.islice(iterator, FEED_BATCH_SIZE))
+            if not batch:
+                return
+            for task in batch:
+                if task.image_url in self._waiting:
+                    self._waiting[task.image_url].append(task)
+                elif task.image_url in self._finished:
+                    self._report_duplicate(self._finished[task.image_url], task)
+                else:
+                    self._waiting[task.image_url] = []
+                    await self._room.wait()
+                    await self.queue.put(task)
+
+    # Worker coroutine: keeps pulling tasks until the queue is drained. One task failing in an
+    # unexpected way is reported as failed; it never takes the worker (and the run) down with it.
+    async def _worker(self):
+        while True:
+            task = await self.queue.get()
+            try:
+                if task is None:
+                    return
+                await self._handle(task)
+            except Exception as e:
+                self._finish(DownloadResult(task, f"Error: {e!r}", 0, None))
+            finally:
+                self.queue.task_done()
+
+    # Function to start one task's download, or hold it aside while its host is busy or paused
+    async def _handle(self, task):
+        host = host_of(task.image_url)
+        paused = self.breaker.blocked_for(host)
+        if paused:
+            self._pause(host, task, paused)  # Host is cooling down; serve other hosts meanwhile
+            return
+        if not self.concurrency.try_acquire(host):
+            self._hold(self._parked, host, task)  # Host is at its limit
+            return
+        started = time.perf_counter()
+        timing = {}
+        result = None
+        try:
+            result = await download_image(self.session, task, self.blob_store,
+                                          self._process if self.cpu_pool else None, timing)
+        finally:
+            self._release(host, started, timing, result)
+        if self.metrics:
+            self.metrics.record_timing(host, timing, result.size)
+        if result.retryable:
+            self.breaker.record_failure(host, result.retry_after)
+            attempt = task.attempt + 1
+            if self.retry_policy.should_retry(attempt):
+                self._retry_later(task._replace(attempt=attempt),
+                                  self.retry_policy.delay(attempt, result.retry_after))
+                return
+            result = result._replace(reason=f"{result.reason} (gave up after {attempt} attempts)")
+        elif result.reason is None:
+            self.breaker.record_success(host)
+        self._finish(result)
+
+    # Function to give a host's slot back, feeding the request's outcome to the concurrency
+    # controller (time to first byte for a success), and hand freed slots to waiting tasks
+    def _release(self, host, started, timing, result):
+        if result is not None and result.reason is None and 'headers' in timing:
+            self.concurrency.release(host, latency=timing['headers'] - started)
+        else:
+            self.concurrency.release(host, congested=result is not None and result.retryable)
+        if self.metrics:
+            self.metrics.record_limit(host, self.concurrency.limit(host))
+
+        parked = self._parked.get(host)
+        if parked:
+            for task in self._unhold(parked, min(len(parked), self.concurrency.free_slots(host))):
+                self._retry_later(task, 0)
+
+    # Function to set a task aside in held (host -> tasks) and stop the producer once too many are
+    def _hold(self, held, host, task):
+        held.setdefault(host, deque()).append(task)
+        self._held += 1
+        if self._held >= self.hold_limit:
+            self._room.clear()
+
+    # Function to take the first count tasks out of a host's held tasks and let the producer go on
+    def _unhold(self, tasks, count):
+        taken = [tasks.popleft() for _ in range(count)]
+        self._held -= count
+        if self._held < self.hold_limit:
+            self._room.set()
+        return taken
+
+    # Function to hold a task until its host's breaker closes. One sleeping coroutine per paused
+    # host puts them all back on the queue, rather than one per task.
+    def _pause(self, host, task, delay):
+        waking = host in self._paused
+        self._hold(self._paused, host, task)
+        if waking:
+            return
+
+        async def wake():
+            await asyncio.sleep(delay)
+            paused = self._paused.pop(host)
+            while paused:
+                await self.queue.put(self._unhold(paused, 1)[0])
+        retry = asyncio.create_task(wake())
+        self._retrying.add(retry)
+        retry.add_done_callback(self._retrying.discard)
+
+    # Function to park a task and put it back on the queue after a delay, without holding a worker
+    def _retry_later(self, task, delay):
+        async def requeue():
+            await asyncio.sleep(delay)
+            await self.queue.put(task)
+        retry = asyncio.create_task(requeue())
+        self._retrying.add(retry)
+        retry.add_done_callback(self._retrying.discard)
+
+    # Function to report a fetch and pass its outcome on to the tasks waiting on the same URL.
+    # Only what a later duplicate needs is kept per URL; a whole result (task, validators, retry
+    # hints) for every unique URL of a large catalog would add up to a lot of memory.
+    def _finish(self, result):
+        url = result.task.image_url
+        outcome = (result.task.image_path, result.reason, result.size, result.sha256, result.not_modified)
+        self._finished[url] = outcome
+        self.on_result(result)
+        for task in self._waiting.pop(url, []):
+            self._report_duplicate(outcome, task)
+
+    # Function to hand the outcome of an already fetched URL to another task that listed it
+    def _report_duplicate(self, outcome, task):
+        image_path, reason, size, sha256, not_modified = outcome
+        if reason is None:
+            # Processing may have changed the extension; the duplicate gets the same one
+            extension = os.path.splitext(image_path)[1]
+            task = task._replace(image_path=os.path.splitext(task.image_path)[0] + extension)
+            try:
+                materialize(image_path, task.image_path)
+            except OSError as e:
+                self.on_result(DownloadResult(task, f"Request Error: {e}", 0, None, duplicate=True))
+                return
+        self.on_result(DownloadResult(task, reason, size, sha256, not_modified=not_modified, duplicate=True))
+
+# Function to download every task, calling on_result(DownloadResult) as each one finishes
+def run_downloads(tasks, on_result, max_connections=1000, per_host_connections=100, timeout=10,
+                  blob_store=None, process_options=None, cpu_workers=None, metrics=None, log=print):
+    engine = DownloadEngine(on_result, max_connections, per_host_connections, timeout, blob_store,
+                            process_options=process_options, cpu_workers=cpu_workers, metrics=metrics, log=log)
+    asyncio.run(engine.run(tasks))
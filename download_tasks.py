@@ -0,0 +1,24 @@
+from collections import namedtuple
+
+# Task and result types of download_engine, kept apart so building tasks (e.g. a run that turns
+# out to have nothing to download) does not import aiohttp
+
+# One image to fetch: the part it belongs to, where it comes from and where it goes.
+# etag / last_modified come from an earlier download and turn the request into a conditional one.
+# attempt counts the transient failures so far.
+DownloadTask = namedtuple(
+    'DownloadTask',
+    ['part_number', 'image_url', 'image_path', 'etag', 'last_modified', 'attempt'],
+    defaults=[None, None, 0],
+)
+
+# Outcome of one task; reason is None when the download succeeded.
+# not_modified is True when the server answered 304 and the file on disk was kept.
+# retryable marks transient failures (timeouts, resets, 429/5xx); retry_after is the server's hint in seconds.
+# duplicate is True for a task that repeated a URL and got the bytes another task fetched.
+DownloadResult = namedtuple(
+    'DownloadResult',
+    ['task', 'reason', 'size', 'sha256', 'etag', 'last_modified', 'not_modified', 'retryable', 'retry_after',
+     'duplicate'],
+    defaults=[None, None, False, False, None, False],
+)
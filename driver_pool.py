@@ -0,0 +1,77 @@
+import queue
+import threading
+from contextlib import contextmanager
+
+# A WebDriver kept alive between part numbers, with the number of parts it has served
+class _PooledDriver:
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses = 0
+
+# Pool of long-lived browser sessions, at most one per worker thread.
+# create_driver() launches a browser and gets it ready (home page loaded, popup dismissed),
+# so that cost is paid once per driver instead of once per part number. Drivers are
+# health-checked on checkout and recycled after max_uses parts or after any error.
+class DriverPool:
+    def __init__(self, create_driver, size, max_uses=100):
+        self.create_driver = create_driver
+        self.size = size
+        self.max_uses = max_uses
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    # Context manager that checks a ready driver out of the pool for one part number
+    @contextmanager
+    def driver(self):
+        self._slots.acquire()
+        pooled = None
+        try:
+            pooled = self._checkout()
+            try:
+                yield pooled.driver
+            except Exception:
+                # The page may be in any state (or the browser may have crashed): start over next time
+                self._quit(pooled)
+                pooled = None
+                raise
+            pooled.uses += 1
+            if pooled.uses >= self.max_uses:
+                self._quit(pooled)
+                pooled = None
+        finally:
+            if pooled is not None:
+                self._idle.put(pooled)
+            self._slots.release()
+
+    # Function to quit every idle driver (call once all workers are done)
+    def close(self):
+        while True:
+            try:
+                self._quit(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+    def _checkout(self):
+        while True:
+            try:
+                pooled = self._idle.get_nowait()
+            except queue.Empty:
+                return _PooledDriver(self.create_driver())
+            if self._is_healthy(pooled.driver):
+                return pooled
+            self._quit(pooled)
+
+    @staticmethod
+    def _is_healthy(driver):
+        try:
+            driver.current_url  # Any round trip to the browser fails once the session is gone
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _quit(pooled):
+        try:
+            pooled.driver.quit()
+        except Exception:
+            pass
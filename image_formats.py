@@ -0,0 +1,68 @@
+import os
+
+# Leading bytes of the image formats we accept, mapped to the extension the file should get
+_SIGNATURES = [
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp'),
+    (b'II*\x00', 'tiff'),
+    (b'MM\x00*', 'tiff'),
+]
+
+# Bytes needed to tell every format above apart
+SNIFF_SIZE = 16
+
+# Function to identify an image from its first bytes; None for anything else (HTML error pages, JSON, ...)
+def sniff_format(head):
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    for signature, extension in _SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    return None
+
+# Extensions that are other names for a format sniff_format reports
+_FORMAT_ALIASES = {'jpeg': 'jpg', 'tif': 'tiff'}
+
+# Function to get the format a filename's extension names ('IMG.JPG' -> 'jpg', 'a.tif' -> 'tiff')
+def extension_format(filename):
+    extension = os.path.splitext(filename)[1][1:].lower()
+    return _FORMAT_ALIASES.get(extension, extension)
+
+# Function to get the name a file gets when converted to output_format (None: no conversion).
+# A name that already names that format is kept as it is (IMG.JPG, a.jpeg).
+def converted_filename(filename, output_format):
+    if output_format is None or extension_format(filename) == output_format:
+        return filename
+    return f"{os.path.splitext(filename)[0]}.{output_format}"
+
+# Function to check whether two paths are the same file (also across case on Windows/macOS)
+def same_file(path, other_path):
+    try:
+        return os.path.samefile(path, other_path)
+    except OSError:
+        return os.path.normcase(os.path.abspath(path)) == os.path.normcase(os.path.abspath(other_path))
+
+# File extensions the folder tools (remove-watermark.py) pick up: every format a download can be saved as
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.tif', '.tiff')
+
+# Function to list the image files in a folder
+def list_images(input_folder, extensions=IMAGE_EXTENSIONS):
+    return sorted(
+        filename for filename in os.listdir(input_folder)
+        if filename.lower().endswith(extensions)
+    )
+
+# Function to check whether an output already exists and is newer than its input
+def is_up_to_date(input_path, output_path):
+    try:
+        return os.path.getmtime(output_path) >= os.path.getmtime(input_path)
+    except OSError:
+        return False
+
+# Function to split the work into chunks so every core gets several (keeps the pool balanced)
+def make_chunks(jobs, workers):
+    chunk_size = max(1, min(64, len(jobs) // (workers * 4)))
+    return [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
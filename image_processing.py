@@ -0,0 +1,219 @@
+import hashlib
+import os
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from image_formats import same_file, sniff_format
+from watermark_core import detect_watermark_mask, remove_watermark_roi
+
+# What to do with a downloaded image before it is written.
+#   remove_watermark: detect and inpaint the watermark
+#   max_edge: shrink so the longest edge is at most this many pixels (None keeps the size)
+#   output_format: 'jpg', 'png' or 'webp' to re-encode (None keeps the source format)
+#   quality: JPEG/WebP quality used when re-encoding
+ProcessOptions = namedtuple(
+    'ProcessOptions',
+    ['remove_watermark', 'max_edge', 'output_format', 'quality'],
+    defaults=[False, None, None, 90],
+)
+
+# What normalize_image_file does to every stored image (metadata is always stripped).
+#   max_edge: shrink so the longest edge is at most this many pixels (None keeps the size)
+#   output_format: 'jpg', 'png' or 'webp' to convert to (None keeps the source format)
+#   quality: JPEG/WebP quality of the re-encoded file
+NormalizeOptions = namedtuple(
+    'NormalizeOptions',
+    ['max_edge', 'output_format', 'quality'],
+    defaults=[None, None, 85],
+)
+
+# Function to get the imencode parameters for a format and quality
+def encode_params(extension, quality):
+    if extension == 'jpg':
+        return [cv2.IMWRITE_JPEG_QUALITY, quality]
+    if extension == 'webp':
+        return [cv2.IMWRITE_WEBP_QUALITY, quality]
+    if extension == 'png':
+        return [cv2.IMWRITE_PNG_COMPRESSION, 6]
+    return []
+
+# Function to shrink an image so its longest edge is at most max_edge (never enlarges)
+def cap_longest_edge(image, max_edge):
+    height, width = image.shape[:2]
+    scale = max_edge / max(height, width)
+    if scale >= 1:
+        return image
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+# Function to bring a 16-bit or float image (PNG, TIFF) down to the 8-bit range detection works on
+def to_8bit(image):
+    if image.dtype == np.uint8:
+        return image
+    if image.dtype == np.uint16:
+        return (image >> 8).astype(np.uint8)
+    return cv2.normalize(image, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+
+# Function to write a file under a temporary name and rename it, so the final name never holds half a file
+def write_atomically(path, data):
+    with open(path + '.part', 'wb') as file:
+        file.write(data)
+    os.replace(path + '.part', path)
+
+# Function run on the CPU pool: validate a downloaded body by decoding it from memory, apply the
+# requested processing and write the result once to target_base + '.' + extension.
+# Returns (extension, size, sha256) of what was written; raises ValueError for corrupt images and
+# for images OpenCV cannot work on.
+def process_image_bytes(body, target_base, options):
+    try:
+        return _process_image_bytes(body, target_base, options)
+    except cv2.error as e:
+        raise ValueError(f"OpenCV could not process the image ({e.err})") from None
+
+def _process_image_bytes(body, target_base, options):
+    source_format = sniff_format(body[:16])
+    if source_format is None:
+        raise ValueError("Not an image")
+
+    image = cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise ValueError(f"Corrupt {source_format} image")
+
+    extension = options.output_format or source_format
+    transformed = options.remove_watermark or options.max_edge
+    if transformed:
+        if options.remove_watermark:
+            # Watermark detection works on 3-channel 8-bit images
+            image = to_8bit(image)
+            if image.ndim == 2:
+                image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+            elif image.shape[2] == 4:
+                image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+            image = remove_watermark_roi(image, detect_watermark_mask(image))
+        if options.max_edge:
+            image = cap_longest_edge(image, options.max_edge)
+
+    if transformed or extension != source_format:
+        ok, encoded = cv2.imencode('.' + extension, image, encode_params(extension, options.quality))
+        if not ok:
+            raise ValueError(f"Could not encode {extension}")
+        data = encoded.tobytes()
+    else:
+        data = body  # Valid and unchanged: keep the original bytes
+
+    write_atomically(f"{target_base}.{extension}", data)
+    return extension, len(data), hashlib.sha256(data).hexdigest()
+
+# JPEG markers that carry no metadata even though they sit among the APPn segments:
+# APP0 (JFIF header) and APP14 (Adobe colour transform, needed to decode CMYK/YCCK files)
+_JPEG_KEPT_APP_MARKERS = {0xE0, 0xEE}
+
+# PNG ancillary chunks that are part of the image itself (transparency, animation)
+_PNG_KEPT_CHUNKS = {b'tRNS', b'acTL', b'fcTL', b'fdAT'}
+
+# Function to drop the APPn segments (EXIF, XMP, ICC, ...) and comments from a JPEG without
+# touching the compressed image data
+def _strip_jpeg_metadata(body):
+    kept = [body[:2]]
+    position = 2
+    while position + 4 <= len(body) and body[position] == 0xFF:
+        marker = body[position + 1]
+        if marker == 0xFF:
+            position += 1  # Fill byte
+            continue
+        if marker == 0xDA:
+            break  # Start of scan: everything after it is image data
+        end = position + 2 + int.from_bytes(body[position + 2:position + 4], 'big')
+        metadata = marker == 0xFE or (0xE0 <= marker <= 0xEF and marker not in _JPEG_KEPT_APP_MARKERS)
+        if not metadata:
+            kept.append(body[position:end])
+        position = end
+    else:
+        raise ValueError("Malformed jpg segments")
+    kept.append(body[position:])
+    return b''.join(kept)
+
+# Function to drop the ancillary chunks (text, EXIF, ICC, timestamps, ...) from a PNG without
+# touching the compressed image data
+def _strip_png_metadata(body):
+    kept = [body[:8]]
+    position = 8
+    while position + 8 <= len(body):
+        chunk_type = body[position + 4:position + 8]
+        end = position + 12 + int.from_bytes(body[position:position + 4], 'big')
+        if chunk_type[:1].isupper() or chunk_type in _PNG_KEPT_CHUNKS:
+            kept.append(body[position:end])
+        position = end
+        if chunk_type == b'IEND':
+            return b''.join(kept)
+    raise ValueError("Malformed png chunks")
+
+# Lossless metadata strippers by format
+_METADATA_STRIPPERS = {'jpg': _strip_jpeg_metadata, 'png': _strip_png_metadata}
+
+# Function run on the CPU pool: re-encode one stored image without its metadata (EXIF, XMP, ICC,
+# comments), capped to options.max_edge, in options.output_format (default: its own format), and
+# write it to target_path. An existing target_path is only ever replaced when it is the source
+# itself or replaceable (the file this source was normalized to by an earlier pass); any other
+# file there raises ValueError instead of being overwritten.
+# When re-encoding would only make a same-size JPEG or PNG bigger, its original encoding is kept
+# instead with the metadata segments cut out losslessly (status 'kept'; nothing is written when
+# that leaves an in-place file as it is). A source whose SHA-256 is in skip_sha256 (already
+# normalized by an earlier pass) is left alone ('unchanged').
+# Returns (status, source_sha256, source_bytes, output_bytes, output_sha256); raises ValueError for
+# files that are not images or cannot be decoded.
+def normalize_image_file(source_path, target_path, options, skip_sha256=(), replaceable=None):
+    with open(source_path, 'rb') as file:
+        body = file.read()
+    source_sha256 = hashlib.sha256(body).hexdigest()
+    if source_sha256 in skip_sha256:
+        return 'unchanged', source_sha256, len(body), None, None
+
+    in_place = same_file(target_path, source_path)
+    if not in_place and os.path.exists(target_path) and not (replaceable and same_file(target_path, replaceable)):
+        raise ValueError(f"{os.path.basename(target_path)} already exists; not overwriting it")
+
+    source_format = sniff_format(body[:16])
+    if source_format is None:
+        raise ValueError("Not an image")
+
+    # IMREAD_COLOR applies the EXIF orientation to the pixels, so dropping EXIF keeps JPEGs upright;
+    # other formats are read unchanged to keep their alpha channel
+    flags = cv2.IMREAD_COLOR if source_format == 'jpg' else cv2.IMREAD_UNCHANGED
+    image = cv2.imdecode(np.frombuffer(body, dtype=np.uint8), flags)
+    if image is None:
+        raise ValueError(f"Corrupt {source_format} image")
+
+    extension = options.output_format or source_format
+    resized = cap_longest_edge(image, options.max_edge) if options.max_edge else image
+    ok, encoded = cv2.imencode('.' + extension, resized, encode_params(extension, options.quality))
+    if not ok:
+        raise ValueError(f"Could not encode {extension}")
+    data = encoded.tobytes()
+
+    status = 'normalized'
+    strip = _METADATA_STRIPPERS.get(source_format)
+    if strip and len(data) >= len(body) and extension == source_format and resized is image:
+        stripped = strip(body)
+        # Without the EXIF block a rotated JPEG would show sideways; keep those re-encoded upright
+        if source_format != 'jpg' or np.array_equal(image, cv2.imdecode(
+                np.frombuffer(stripped, dtype=np.uint8), cv2.IMREAD_COLOR)):
+            status, data = 'kept', stripped
+
+    if data != body or not in_place:
+        write_atomically(target_path, data)
+    return status, source_sha256, len(body), len(data), hashlib.sha256(data).hexdigest()
+
+# Function run on the CPU pool: normalize a chunk of (source_path, target_path, skip_sha256, replaceable)
+# jobs; returns (source_path, result of normalize_image_file or None, error message or None) for each
+def normalize_chunk(jobs, options):
+    results = []
+    for source_path, target_path, skip_sha256, replaceable in jobs:
+        try:
+            results.append((source_path, normalize_image_file(source_path, target_path, options, skip_sha256,
+                                                              replaceable), None))
+        except (OSError, ValueError, cv2.error) as e:
+            results.append((source_path, None, str(e)))
+    return results
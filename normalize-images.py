@@ -0,0 +1,121 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from image_formats import converted_filename, list_images, make_chunks, same_file
+from normalize_ledger import NormalizeLedger
+
+# Files the normalization pass picks up in a folder
+NORMALIZE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff')
+
+def _megabytes(size):
+    return f"{size / 1e6:.1f} MB"
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Shrink a folder of downloaded images: strip metadata, cap the longest edge and re-encode")
+    parser.add_argument('--input-folder', required=True, help="Folder of downloaded images (a save folder, Supersprint_images, ...)")
+    parser.add_argument('--output-folder', help="Where to write the normalized images (default: replace them in place)")
+    parser.add_argument('--max-edge', type=int, default=2048, help="Longest edge in pixels (0 keeps the size)")
+    parser.add_argument('--format', choices=['jpg', 'png', 'webp'], help="Convert every image to this format (default: keep)")
+    parser.add_argument('--quality', type=int, default=85, help="JPEG/WebP quality of the re-encoded images")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="Worker processes (default: one per core; 1 runs in this process)")
+    parser.add_argument('--force', action='store_true', help="Re-normalize files even if they are unchanged since the last pass")
+    parser.add_argument('--report', help="Write the per-file size savings of every normalized file to this CSV")
+    args = parser.parse_args()
+
+    output_folder = args.output_folder or args.input_folder
+    in_place = os.path.abspath(output_folder) == os.path.abspath(args.input_folder)
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    # The ledger remembers what every file was normalized from, so unchanged files are skipped by hash
+    ledger = NormalizeLedger(os.path.join(output_folder, 'normalize_ledger.sqlite'))
+    jobs = []
+    collisions = []
+    claimed = set()  # Output names (case-folded where the filesystem is) already taken in this pass
+    # Files that keep their name claim it first, so a conversion never takes an existing image's name
+    filenames = sorted(list_images(args.input_folder, NORMALIZE_EXTENSIONS),
+                       key=lambda filename: converted_filename(filename, args.format) != filename)
+    for filename in filenames:
+        output_name = converted_filename(filename, args.format)
+        if os.path.normcase(output_name) in claimed:
+            collisions.append((filename, output_name))  # e.g. a.jpg and a.png both converting to a.webp
+            continue
+        claimed.add(os.path.normcase(output_name))
+
+        entry = ledger.entry(filename)
+        skip_sha256 = replaceable = None
+        if entry and os.path.exists(os.path.join(output_folder, entry.output_name)):
+            replaceable = os.path.join(output_folder, entry.output_name)
+            # A pass converting to another format than last time redoes the file
+            if not args.force and entry.output_name == output_name:
+                skip_sha256 = (entry.source_sha256, entry.output_sha256)
+        jobs.append((os.path.join(args.input_folder, filename), os.path.join(output_folder, output_name),
+                     skip_sha256 or (), replaceable))
+
+    for filename, output_name in collisions:
+        print(f"Could not normalize {filename}: another image is already written to {output_name}")
+    if not jobs:
+        ledger.close()
+        print("No images found.")
+        return
+
+    # OpenCV and NumPy are only imported once there is an image to work on
+    from image_processing import NormalizeOptions, normalize_chunk
+    options = NormalizeOptions(args.max_edge or None, args.format, args.quality)
+
+    start = time.perf_counter()
+    counts = {'normalized': 0, 'kept': 0, 'unchanged': 0, 'failed': len(collisions)}
+    pass_before = pass_after = 0
+
+    # Record each file as its chunk comes back
+    def report(chunk_results):
+        nonlocal pass_before, pass_after
+        for source_path, result, error in chunk_results:
+            filename = os.path.basename(source_path)
+            if result is None:
+                counts['failed'] += 1
+                print(f"Could not normalize {filename}: {error}")
+                continue
+            status, source_sha256, source_bytes, output_bytes, output_sha256 = result
+            counts[status] += 1
+            if status == 'unchanged':
+                continue
+            output_name = converted_filename(filename, args.format)
+            if in_place and not same_file(source_path, os.path.join(output_folder, output_name)):
+                os.remove(source_path)  # Converted in place: only the new format stays
+            ledger.record(filename, source_sha256, output_name, output_sha256, source_bytes, output_bytes, status)
+            pass_before += source_bytes
+            pass_after += output_bytes
+
+    try:
+        if args.workers <= 1:
+            report(normalize_chunk(jobs, options))
+        else:
+            with ProcessPoolExecutor(max_workers=args.workers) as executor:
+                futures = [executor.submit(normalize_chunk, chunk, options) for chunk in make_chunks(jobs, args.workers)]
+                for future in as_completed(futures):
+                    report(future.result())
+
+        elapsed = time.perf_counter() - start
+        print(f"{counts['normalized']} normalized, {counts['kept']} kept their encoding (metadata stripped), "
+              f"{counts['unchanged']} unchanged since the last pass, {counts['failed']} failed in {elapsed:.1f}s")
+        if pass_before:
+            print(f"This pass: {_megabytes(pass_before)} -> {_megabytes(pass_after)} "
+                  f"(saved {(pass_before - pass_after) / pass_before * 100:.1f}%)")
+        files, total_before, total_after = ledger.totals()
+        if total_before:
+            print(f"All {files} normalized files: {_megabytes(total_before)} -> {_megabytes(total_after)} "
+                  f"(saved {(total_before - total_after) / total_before * 100:.1f}%)")
+        if args.report:
+            ledger.export_csv(args.report)
+            print(f"Per-file savings written to {args.report}")
+    finally:
+        ledger.close()
+
+# Required for process pools on Windows, where workers re-import this script
+if __name__ == "__main__":
+    main()
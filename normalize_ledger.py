@@ -0,0 +1,97 @@
+import csv
+import sqlite3
+import time
+from collections import namedtuple
+
+# Pending updates are committed in batches of this size
+COMMIT_BATCH_SIZE = 500
+
+# Last normalization of one file: the source it was made from, what was written and the sizes
+LedgerEntry = namedtuple(
+    'LedgerEntry',
+    ['name', 'source_sha256', 'output_name', 'output_sha256', 'source_bytes', 'output_bytes', 'status', 'updated_at'],
+)
+
+# Record of every file normalize-images.py has processed in a folder, keyed by source filename.
+# It tells the next pass which files are unchanged since (by SHA-256) and keeps the per-file size
+# savings for reporting.
+class NormalizeLedger:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._pending = []
+        self._conn = sqlite3.connect(db_path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS normalized (
+                name TEXT PRIMARY KEY,
+                source_sha256 TEXT NOT NULL,
+                output_name TEXT NOT NULL,
+                output_sha256 TEXT NOT NULL,
+                source_bytes INTEGER NOT NULL,
+                output_bytes INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS normalized_output ON normalized (output_name)')
+        self._conn.commit()
+
+    # Function to get the last normalization of a file, found by its source name or, for a file
+    # converted in place (a.jpg -> a.webp), by its output name (None if it was never normalized)
+    def entry(self, name):
+        self._flush()
+        row = self._conn.execute(
+            'SELECT name, source_sha256, output_name, output_sha256, source_bytes, output_bytes, status, updated_at '
+            'FROM normalized WHERE name = ? OR output_name = ? ORDER BY name = ? DESC LIMIT 1', (name, name, name),
+        ).fetchone()
+        return LedgerEntry(*row) if row else None
+
+    # Function to record a normalized (or kept) file
+    def record(self, name, source_sha256, output_name, output_sha256, source_bytes, output_bytes, status):
+        self._pending.append((name, source_sha256, output_name, output_sha256, source_bytes, output_bytes,
+                              status, time.time()))
+        if len(self._pending) >= COMMIT_BATCH_SIZE:
+            self._flush()
+
+    # Function to sum up every recorded file -> (files, source bytes, output bytes)
+    def totals(self):
+        self._flush()
+        files, source_bytes, output_bytes = self._conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(source_bytes), 0), COALESCE(SUM(output_bytes), 0) FROM normalized'
+        ).fetchone()
+        return files, source_bytes, output_bytes
+
+    # Function to write the per-file savings as CSV
+    def export_csv(self, path):
+        self._flush()
+        with open(path, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(['name', 'output_name', 'status', 'source_bytes', 'output_bytes', 'saved_bytes', 'saved_percent'])
+            for name, output_name, status, source_bytes, output_bytes in self._conn.execute(
+                'SELECT name, output_name, status, source_bytes, output_bytes FROM normalized ORDER BY name'
+            ):
+                saved = source_bytes - output_bytes
+                writer.writerow([name, output_name, status, source_bytes, output_bytes, saved,
+                                 f"{saved / source_bytes * 100:.1f}" if source_bytes else "0.0"])
+
+    # Function to commit pending updates and close the database
+    def close(self):
+        self._flush()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        self._conn.executemany('''
+            INSERT OR REPLACE INTO normalized
+                (name, source_sha256, output_name, output_sha256, source_bytes, output_bytes, status, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', self._pending)
+        self._conn.commit()
+        self._pending = []
@@ -1,49 +1,91 @@
-import cv2
-import numpy as np
+import argparse
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from image_formats import is_up_to_date, list_images, make_chunks
 
 # Folder paths
 input_folder = r"C:\Users\Sherwin\Desktop\Karbonius_imgs"
 output_folder = r"C:\Users\Sherwin\Desktop\Karbonius_imgs_cleaned"
 
-# Ensure output folder exists
-if not os.path.exists(output_folder):
-    os.makedirs(output_folder)
-
-# Process all images in the input folder
-for filename in os.listdir(input_folder):
-    if filename.endswith(".jpg") or filename.endswith(".png"):
-        image_path = os.path.join(input_folder, filename)
-        image = cv2.imread(image_path)
-
-        if image is None:
-            continue
-        
-        # Convert image to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        
-        # Use edge detection (Canny)
-        edges = cv2.Canny(gray, 50, 150)  # Adjust threshold if needed
-        
-        # Apply threshold to highlight watermark
-        _, thresh = cv2.threshold(edges, 50, 255, cv2.THRESH_BINARY)
-        
-        # Find contours (possible watermark areas)
-        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-        # Create a mask for detected watermark
-        mask = np.zeros_like(gray)
-        
-        for contour in contours:
-            x, y, w, h = cv2.boundingRect(contour)
-            if w > 50 and h > 10:  # Filter small noise (adjust values)
-                cv2.drawContours(mask, [contour], -1, (255), thickness=cv2.FILLED)
-
-        # Inpaint to remove watermark
-        inpainted_image = cv2.inpaint(image, mask, inpaintRadius=3, flags=cv2.INPAINT_TELEA)
-
-        # Save the processed image
-        output_path = os.path.join(output_folder, filename)
-        cv2.imwrite(output_path, inpainted_image)
-
-print("Automatic watermark detection and removal completed.")
+def main():
+    parser = argparse.ArgumentParser(description="Automatically detect and remove watermarks")
+    parser.add_argument('--input-folder', default=input_folder)
+    parser.add_argument('--output-folder', default=output_folder)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="Worker processes (default: one per core; 1 runs in this process)")
+    parser.add_argument('--force', action='store_true',
+                        help="Re-process images even when the output is newer than the input")
+    parser.add_argument('--shared-mask', action='store_true',
+                        help="Estimate one watermark mask per supplier and image size from a sample and apply it to every image")
+    parser.add_argument('--supplier', help="Name the shared masks are cached under (default: input folder name)")
+    parser.add_argument('--mask-cache', help="Folder for cached masks (default: <output folder>/_masks)")
+    parser.add_argument('--mask-sample', type=int, default=50, help="Images sampled per image size")
+    parser.add_argument('--rebuild-mask', action='store_true', help="Re-estimate cached masks")
+    parser.add_argument('--roi', action='store_true',
+                        help="Inpaint only padded crops around the watermark instead of the full image")
+    args = parser.parse_args()
+
+    # Ensure output folder exists
+    if not os.path.exists(args.output_folder):
+        os.makedirs(args.output_folder)
+
+    # Skip outputs that already exist and are newer than their inputs
+    jobs = []
+    skipped = 0
+    for filename in list_images(args.input_folder):
+        input_path = os.path.join(args.input_folder, filename)
+        output_path = os.path.join(args.output_folder, filename)
+        if not args.force and is_up_to_date(input_path, output_path):
+            skipped += 1
+        else:
+            jobs.append((input_path, output_path))
+    print(f"{len(jobs)} images to process, {skipped} already up to date")
+    if not jobs:
+        print("Automatic watermark detection and removal completed.")
+        return
+
+    # OpenCV and NumPy are only imported once there is an image to work on
+    from watermark_core import build_mask_cache, process_chunk, process_image
+
+    # Shared mask mode: detect once per supplier and image size instead of once per image
+    shared_masks = None
+    if args.shared_mask:
+        supplier = args.supplier or os.path.basename(os.path.normpath(args.input_folder))
+        mask_cache = args.mask_cache or os.path.join(args.output_folder, "_masks")
+        all_inputs = [os.path.join(args.input_folder, filename) for filename in list_images(args.input_folder)]
+        for cache_path in build_mask_cache(all_inputs, mask_cache, supplier, args.mask_sample,
+                                           rebuild=args.rebuild_mask):
+            print(f"Estimated shared mask {cache_path}")
+        shared_masks = (mask_cache, supplier)
+
+    start = time.perf_counter()
+    timings = []
+
+    # Per-image timing, printed as each chunk comes back
+    def report(chunk_results):
+        for filename, seconds in chunk_results:
+            if seconds is None:
+                print(f"Could not read {filename}, skipped")
+            else:
+                timings.append(seconds)
+                print(f"{filename}: {seconds * 1000:.0f} ms")
+
+    if args.workers <= 1:
+        report(process_image(input_path, output_path, shared_masks, args.roi) for input_path, output_path in jobs)
+    else:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            futures = [executor.submit(process_chunk, chunk, shared_masks, args.roi) for chunk in make_chunks(jobs, args.workers)]
+            for future in as_completed(futures):
+                report(future.result())
+
+    elapsed = time.perf_counter() - start
+    if timings:
+        print(f"Processed {len(timings)} images in {elapsed:.1f}s "
+              f"({len(timings) / elapsed:.1f} images/s, {sum(timings) / len(timings) * 1000:.0f} ms/image average)")
+    print("Automatic watermark detection and removal completed.")
+
+# Required for process pools on Windows, where workers re-import this script
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+import email.utils
+import heapq
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from adaptive_concurrency import AdaptiveConcurrency
+
+# HTTP statuses worth retrying: throttling, timeouts and transient server/CDN errors
+RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+# Raised by a download job when the failure is transient and the job should run again later
+class RetryLater(Exception):
+    def __init__(self, reason, retry_after=None):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+# Function to get the host a URL belongs to (the unit the circuit breaker works on)
+def host_of(url):
+    return urlsplit(url).netloc.lower()
+
+# Function to turn a Retry-After header (seconds or an HTTP date) into seconds from now
+def parse_retry_after(value):
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+# Exponential backoff with full jitter; a server's Retry-After always wins over our own guess
+class RetryPolicy:
+    def __init__(self, max_attempts=5, base_delay=1.0, max_delay=60.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    # Function to check whether a job that has failed `attempt` times may run again
+    def should_retry(self, attempt):
+        return attempt < self.max_attempts
+
+    # Function to get how long to wait before the next attempt (attempt counts failures so far)
+    def delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(retry_after, self.max_delay * 5)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+# Per-host circuit breaker: after failure_threshold consecutive failures a host is paused for
+# cooldown seconds (doubling while it keeps failing), without holding up any other host.
+# log(message) reports every trip (e.g. a ProgressReporter's log, so the live progress line stays intact).
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, cooldown=30.0, max_cooldown=600.0, log=print):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.log = log
+        self._lock = threading.Lock()
+        self._failures = {}
+        self._open_until = {}
+        self._trips = {}
+
+    # Function to get how many seconds a host is still paused for (0 when requests may go out)
+    def blocked_for(self, host):
+        with self._lock:
+            return max(0.0, self._open_until.get(host, 0.0) - time.monotonic())
+
+    def record_success(self, host):
+        with self._lock:
+            self._failures.pop(host, None)
+            self._trips.pop(host, None)
+
+    # Function to count a transient failure; pause_for forces a pause (e.g. a 429 Retry-After)
+    def record_failure(self, host, pause_for=None):
+        tripped = False
+        with self._lock:
+            failures = self._failures.get(host, 0) + 1
+            self._failures[host] = failures
+            pause = pause_for or 0.0
+            if failures >= self.failure_threshold:
+                trips = self._trips.get(host, 0)
+                self._trips[host] = trips + 1
+                self._failures[host] = 0
+                pause = max(pause, min(self.max_cooldown, self.cooldown * 2 ** trips))
+                tripped = True
+            if pause:
+                self._open_until[host] = max(self._open_until.get(host, 0.0), time.monotonic() + pause)
+        if tripped:
+            self.log(f"Circuit open for {host}: pausing requests for {pause:.0f}s")
+
+# Thread pool for blocking download jobs. A job raising RetryLater is parked on a delay queue
+# and resubmitted when its backoff expires, so no worker thread ever sleeps through a retry.
+# max_workers only caps the threads: how many jobs run against each host at once adapts to that
+# host's job times and failures (see adaptive_concurrency), and jobs for a host at its limit
+# wait aside without taking a thread.
+#   job() -> True when done, False on a permanent failure; may raise RetryLater
+#   on_done(ok, reason) is called once per submitted job, after its final attempt
+#   log(message) reports circuit breaker trips
+class RetryingExecutor:
+    def __init__(self, max_workers, policy=None, breaker=None, concurrency=None, log=print):
+        self.policy = policy or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker(log=log)
+        self.concurrency = concurrency or AdaptiveConcurrency(max_limit=max_workers)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._parked = {}   # host -> job entries waiting for that host's concurrency limit
+        self._delayed = []  # heap of (due, sequence, job entry)
+        self._sequence = 0
+        self._outstanding = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._timer = threading.Thread(target=self._timer_loop, name='retry-timer', daemon=True)
+        self._timer.start()
+
+    def submit(self, job, host, on_done):
+        with self._cond:
+            self._outstanding += 1
+        self._pool.submit(self._run, [job, host, on_done, 0])
+
+    # Function to wait for every job, including ones waiting on a retry, then stop the threads
+    def shutdown(self):
+        with self._cond:
+            while self._outstanding:
+                self._cond.wait()
+            self._closed = True
+            self._cond.notify_all()
+        self._pool.shutdown(wait=True)
+        self._timer.join()
+
+    def _run(self, entry):
+        job, host, on_done, attempt = entry
+        paused = self.breaker.blocked_for(host)
+        if paused:
+            self._schedule(entry, paused)  # Host is cooling down; other hosts keep going
+            return
+        with self._cond:
+            # Checked and parked under one lock, so a slot freed in between can't be missed
+            if not self.concurrency.try_acquire(host):
+                self._parked.setdefault(host, deque()).append(entry)
+                return
+        started = time.monotonic()
+        try:
+            ok = job()
+        except RetryLater as e:
+            self._release(host, congested=True)
+            attempt += 1
+            self.breaker.record_failure(host, e.retry_after)
+            if self.policy.should_retry(attempt):
+                entry[3] = attempt
+                self._schedule(entry, self.policy.delay(attempt, e.retry_after))
+                return
+            ok, reason = False, f"{e.reason} (gave up after {attempt} attempts)"
+        except Exception as e:
+            self._release(host)
+            ok, reason = False, f"Error: {e}"
+        else:
+            self._release(host, latency=time.monotonic() - started if ok else None)
+            reason = None if ok else "Failed"
+            if ok:
+                self.breaker.record_success(host)
+        try:
+            on_done(ok, reason)
+        finally:
+            with self._cond:
+                self._outstanding -= 1
+                self._cond.notify_all()
+
+    # Function to give a host's slot back (job time for a success) and start jobs waiting on it
+    def _release(self, host, latency=None, congested=False):
+        with self._cond:
+            self.concurrency.release(host, latency, congested)
+            parked = self._parked.get(host)
+            if parked:
+                for _ in range(min(len(parked), self.concurrency.free_slots(host))):
+                    self._pool.submit(self._run, parked.popleft())
+
+    def _schedule(self, entry, delay):
+        with self._cond:
+            self._sequence += 1
+            heapq.heappush(self._delayed, (time.monotonic() + delay, self._sequence, entry))
+            self._cond.notify_all()
+
+    def _timer_loop(self):
+        with self._cond:
+            while not self._closed:
+                now = time.monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    _, _, entry = heapq.heappop(self._delayed)
+                    self._pool.submit(self._run, entry)
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                self._cond.wait(timeout)
@@ -0,0 +1,62 @@
+import json
+import queue
+import threading
+import time
+
+# Records are written in batches of this size, or after this many seconds, whichever comes first
+FLUSH_BATCH_SIZE = 1000
+FLUSH_INTERVAL = 1.0
+
+_STOP = object()
+
+# Append-only JSONL journal of download outcomes.
+# Any thread may call record(); a single writer thread owns the file, batches the
+# records and flushes them, so lines never interleave and callers never touch the disk.
+class RunJournal:
+    def __init__(self, journal_path):
+        self.journal_path = journal_path
+        self._queue = queue.SimpleQueue()
+        self._writer = threading.Thread(target=self._write_loop, name='run-journal', daemon=True)
+        self._writer.start()
+
+    # Function to queue one outcome (status is e.g. 'downloaded', 'failed' or 'skipped')
+    def record(self, part_number, image_url, status, reason=None, **fields):
+        entry = {
+            'time': time.time(),
+            'part_number': str(part_number),
+            'image_url': image_url,
+            'status': status,
+            'reason': reason,
+        }
+        entry.update(fields)
+        self._queue.put(entry)
+
+    # Function to flush everything still queued and stop the writer thread
+    def close(self):
+        self._queue.put(_STOP)
+        self._writer.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _write_loop(self):
+        with open(self.journal_path, 'a', encoding='utf-8') as file:
+            stopping = False
+            while not stopping:
+                batch = []
+                deadline = time.monotonic() + FLUSH_INTERVAL
+                while len(batch) < FLUSH_BATCH_SIZE:
+                    try:
+                        entry = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if entry is _STOP:
+                        stopping = True
+                        break
+                    batch.append(json.dumps(entry))
+                if batch:
+                    file.write('\n'.join(batch) + '\n')
+                    file.flush()
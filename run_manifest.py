@@ -0,0 +1,240 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Pending updates are committed in batches of this size
+COMMIT_BATCH_SIZE = 500
+
+# Validators remembered for a URL so repeat runs can send conditional requests
+CacheEntry = namedtuple('CacheEntry', ['version', 'etag', 'last_modified', 'path', 'bytes', 'sha256'])
+
+# Function to split the Shopify-style ?v= version parameter off a URL -> (base_url, version)
+def split_version(url):
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    version = next((value for key, value in query if key == 'v'), None)
+    base_query = urlencode([(key, value) for key, value in query if key != 'v'])
+    return urlunsplit(parts._replace(query=base_query)), version
+
+# Indexed record of every image in a run, keyed by (part_number, url).
+# Resuming a job is one primary-key lookup per image instead of a filesystem stat,
+# and failed rows can be re-run on their own with failed_rows().
+class RunManifest:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        # Lookups come from the CSV producer thread and updates from the download loop
+        self._lock = threading.Lock()
+        self._pending = []
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS images (
+                part_number TEXT NOT NULL,
+                url TEXT NOT NULL,
+                path TEXT,
+                status TEXT NOT NULL,
+                bytes INTEGER,
+                sha256 TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL,
+                PRIMARY KEY (part_number, url)
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS images_status ON images (status)')
+        # Revalidation cache, keyed by the URL without its version parameter so a bumped
+        # ?v= can still be answered with a 304 when the bytes did not actually change
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS url_cache (
+                base_url TEXT PRIMARY KEY,
+                version TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                path TEXT,
+                bytes INTEGER,
+                sha256 TEXT,
+                updated_at REAL
+            )
+        ''')
+        # Image URLs a scraper resolved for each part number, so downloads can be re-driven
+        # without scraping the part again
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS scrape_cache (
+                part_number TEXT PRIMARY KEY,
+                urls TEXT NOT NULL,
+                scraped_at REAL NOT NULL
+            )
+        ''')
+        self._conn.commit()
+
+    # Function to check whether an image was already downloaded in an earlier run
+    def is_done(self, part_number, url):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT status FROM images WHERE part_number = ? AND url = ?',
+                (str(part_number), url),
+            ).fetchone()
+        return row is not None and row[0] == 'downloaded'
+
+    # Function to record the outcome of one attempt ('downloaded' or 'failed')
+    def record(self, part_number, url, path, status, size=None, sha256=None):
+        with self._lock:
+            self._pending.append((str(part_number), url, path, status, size, sha256, time.time()))
+            if len(self._pending) >= COMMIT_BATCH_SIZE:
+                self._flush()
+
+    # Function to look up the cached validators for a URL (None if it was never downloaded)
+    def cached_entry(self, url):
+        base_url, _ = split_version(url)
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT version, etag, last_modified, path, bytes, sha256 FROM url_cache WHERE base_url = ?',
+                (base_url,),
+            ).fetchone()
+        return CacheEntry(*row) if row else None
+
+    # Function to remember the ETag / Last-Modified a server sent for a downloaded URL
+    def record_validators(self, url, path, etag, last_modified, size, sha256):
+        base_url, version = split_version(url)
+        with self._lock:
+            self._conn.execute('''
+                INSERT OR REPLACE INTO url_cache
+                    (base_url, version, etag, last_modified, path, bytes, sha256, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (base_url, version, etag, last_modified, path, size, sha256, time.time()))
+
+    # Function to record a 304 Not Modified as a completed download of the cached file
+    def record_not_modified(self, part_number, url, path):
+        cached = self.cached_entry(url)
+        size, sha256 = (cached.bytes, cached.sha256) if cached else (None, None)
+        self.record(part_number, url, path, 'downloaded', size, sha256)
+        base_url, version = split_version(url)
+        with self._lock:
+            self._conn.execute(
+                'UPDATE url_cache SET version = ?, updated_at = ? WHERE base_url = ?',
+                (version, time.time(), base_url),
+            )
+
+    # Function to get the image URLs scraped for a part number, or None when the part was never
+    # scraped or its entry is older than max_age seconds (None: entries never go stale)
+    def cached_part_urls(self, part_number, max_age=None):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT urls, scraped_at FROM scrape_cache WHERE part_number = ?', (str(part_number),)
+            ).fetchone()
+        if row is None or (max_age is not None and time.time() - row[1] > max_age):
+            return None
+        return json.loads(row[0])
+
+    # Function to remember the image URLs just scraped for a part number
+    def record_part_urls(self, part_number, urls):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO scrape_cache (part_number, urls, scraped_at) VALUES (?, ?, ?)',
+                (str(part_number), json.dumps(list(urls)), time.time()),
+            )
+            self._conn.commit()
+
+    # Function to list (part_number, url, path) for every image whose last attempt failed
+    def failed_rows(self):
+        with self._lock:
+            self._flush()
+            return self._conn.execute(
+                "SELECT part_number, url, path FROM images WHERE status = 'failed' AND path IS NOT NULL"
+            ).fetchall()
+
+    # Function to count the images by status ('downloaded', 'failed', ...)
+    def status_counts(self):
+        with self._lock:
+            self._flush()
+            return dict(self._conn.execute('SELECT status, COUNT(*) FROM images GROUP BY status').fetchall())
+
+    # Function to fold another manifest (e.g. one shard's) into this one; for every image and URL
+    # the most recently updated row wins. keep(part_number), when given, selects the images to copy.
+    def merge_from(self, db_path, keep=None):
+        source = sqlite3.connect(db_path)
+        try:
+            rows = source.execute(
+                'SELECT part_number, url, path, status, bytes, sha256, attempts, updated_at FROM images'
+            ).fetchall()
+            cache_rows = source.execute(
+                'SELECT base_url, version, etag, last_modified, path, bytes, sha256, updated_at FROM url_cache'
+            ).fetchall()
+            try:
+                scrape_rows = source.execute('SELECT part_number, urls, scraped_at FROM scrape_cache').fetchall()
+            except sqlite3.OperationalError:
+                scrape_rows = []  # Manifest written before the scrape cache existed
+        finally:
+            source.close()
+        if keep is not None:
+            rows = [row for row in rows if keep(row[0])]
+            scrape_rows = [row for row in scrape_rows if keep(row[0])]
+        with self._lock:
+            self._flush()
+            self._conn.executemany('''
+                INSERT INTO images (part_number, url, path, status, bytes, sha256, attempts, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (part_number, url) DO UPDATE SET
+                    path = excluded.path,
+                    status = excluded.status,
+                    bytes = excluded.bytes,
+                    sha256 = excluded.sha256,
+                    attempts = excluded.attempts,
+                    updated_at = excluded.updated_at
+                WHERE excluded.updated_at > COALESCE(images.updated_at, 0)
+            ''', rows)
+            self._conn.executemany('''
+                INSERT INTO url_cache (base_url, version, etag, last_modified, path, bytes, sha256, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (base_url) DO UPDATE SET
+                    version = excluded.version,
+                    etag = excluded.etag,
+                    last_modified = excluded.last_modified,
+                    path = excluded.path,
+                    bytes = excluded.bytes,
+                    sha256 = excluded.sha256,
+                    updated_at = excluded.updated_at
+                WHERE excluded.updated_at > COALESCE(url_cache.updated_at, 0)
+            ''', cache_rows)
+            self._conn.executemany('''
+                INSERT INTO scrape_cache (part_number, urls, scraped_at) VALUES (?, ?, ?)
+                ON CONFLICT (part_number) DO UPDATE SET
+                    urls = excluded.urls,
+                    scraped_at = excluded.scraped_at
+                WHERE excluded.scraped_at > scrape_cache.scraped_at
+            ''', scrape_rows)
+            self._conn.commit()
+        return len(rows)
+
+    # Function to commit pending updates and close the database
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._conn.commit()  # Also commits validator updates made outside a batch
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        self._conn.executemany('''
+            INSERT INTO images (part_number, url, path, status, bytes, sha256, attempts, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, 1, ?)
+            ON CONFLICT (part_number, url) DO UPDATE SET
+                path = excluded.path,
+                status = excluded.status,
+                bytes = excluded.bytes,
+                sha256 = excluded.sha256,
+                attempts = images.attempts + 1,
+                updated_at = excluded.updated_at
+        ''', self._pending)
+        self._conn.commit()
+        self._pending = []
@@ -0,0 +1,325 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is unbounded
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Percentile reported for the unbounded bucket (">30"); infinity would not be valid JSON
+OVERFLOW_PERCENTILE = f">{LATENCY_BUCKETS[-1]:g}"
+
+# Fixed-bucket latency histogram: constant memory however many requests a run makes
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def add(self, seconds):
+        index = 0
+        while index < len(LATENCY_BUCKETS) and seconds > LATENCY_BUCKETS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.total += seconds
+        self.count += 1
+
+    # Function to estimate a percentile (0-100) as the upper bound of the bucket it falls in
+    # (OVERFLOW_PERCENTILE when that is the unbounded last bucket)
+    def percentile(self, p):
+        if not self.count:
+            return None
+        target = p / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target and count:
+                return LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else OVERFLOW_PERCENTILE
+        return OVERFLOW_PERCENTILE
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+        }
+
+# Aggregates for every request sent to one host
+class HostStats:
+    def __init__(self):
+        self.requests = 0
+        self.bytes = 0
+        self.statuses = Counter()
+        self.new_connections = 0
+        self.concurrency_limit = None
+        self.connect = Histogram()
+        self.ttfb = Histogram()
+        self.transfer = Histogram()
+
+    def summary(self):
+        return {
+            'requests': self.requests,
+            'bytes': self.bytes,
+            'statuses': dict(self.statuses),
+            'new_connections': self.new_connections,
+            'concurrency_limit': self.concurrency_limit,
+            'connect_seconds': self.connect.summary(),
+            'ttfb_seconds': self.ttfb.summary(),
+            'transfer_seconds': self.transfer.summary(),
+        }
+
+# Thread-safe counters for one run: outcomes of the items (images or parts) being worked through,
+# and connect / time-to-first-byte / transfer timings of every HTTP request, per host.
+# total, when known, is the number of items the run will finish and drives the ETA.
+class RunMetrics:
+    def __init__(self, total=None):
+        self.total = total
+        self.started = time.monotonic()
+        self.outcomes = Counter()
+        self.bytes = 0
+        self.hosts = {}
+        self._lock = threading.Lock()
+
+    def set_total(self, total):
+        self.total = total
+
+    # Function to count a finished item by its outcome ('downloaded', 'failed', 'skipped', ...)
+    def finished(self, outcome, count=1):
+        with self._lock:
+            self.outcomes[outcome] += count
+
+    def _host_stats(self, host):
+        stats = self.hosts.get(host)
+        if stats is None:
+            stats = self.hosts[host] = HostStats()
+        return stats
+
+    # Function to record one HTTP request; connect is None when a pooled connection was reused
+    def record_request(self, host, status, size=0, connect=None, ttfb=None, transfer=None):
+        with self._lock:
+            stats = self._host_stats(host)
+            stats.requests += 1
+            stats.bytes += size
+            stats.statuses[str(status)] += 1
+            self.bytes += size
+            if connect is not None:
+                stats.new_connections += 1
+                stats.connect.add(connect)
+            if ttfb is not None:
+                stats.ttfb.add(ttfb)
+            if transfer is not None:
+                stats.transfer.add(transfer)
+
+    # Function to record the current adaptive concurrency limit of a host
+    def record_limit(self, host, limit):
+        with self._lock:
+            self._host_stats(host).concurrency_limit = limit
+
+    # Function to record a finished requests.Response; started is its time.perf_counter() start.
+    # requests has no connect hook, so connect time is left out (it is part of elapsed).
+    def record_response(self, host, response, started):
+        ttfb = response.elapsed.total_seconds()
+        transfer = max(0.0, time.perf_counter() - started - ttfb)
+        self.record_request(host, response.status_code, len(response.content), None, ttfb, transfer)
+
+    # Function to record a request from the timing dict filled in by trace_config()
+    def record_timing(self, host, timing, size=0):
+        start = timing.get('start')
+        if start is None:
+            return  # The request never went out (e.g. an invalid URL)
+        ttfb = timing.get('ttfb')
+        body_done = timing.get('body_done')
+        transfer = body_done - start - ttfb if ttfb is not None and body_done is not None else None
+        self.record_request(host, timing.get('status', 'error'), size, timing.get('connect'), ttfb, transfer)
+
+    # Function to build an aiohttp TraceConfig that fills the dict passed as each request's
+    # trace_request_ctx with start, connect, ttfb and status
+    def trace_config(self):
+        import aiohttp
+
+        def timing_of(context):
+            timing = context.trace_request_ctx
+            return timing if isinstance(timing, dict) else None
+
+        async def on_request_start(session, context, params):
+            timing = timing_of(context)
+            if timing is not None:
+                timing.clear()
+                timing['start'] = time.perf_counter()
+
+        async def on_connection_create_start(session, context, params):
+            timing = timing_of(context)
+            if timing is not None:
+                timing['connect_start'] = time.perf_counter()
+
+        async def on_connection_create_end(session, context, params):
+            timing = timing_of(context)
+            if timing is not None and 'connect_start' in timing:
+                timing['connect'] = time.perf_counter() - timing['connect_start']
+
+        async def on_request_end(session, context, params):
+            timing = timing_of(context)
+            if timing is not None:
+                timing['ttfb'] = time.perf_counter() - timing['start']
+                timing['status'] = params.response.status
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_create_start.append(on_connection_create_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_request_end.append(on_request_end)
+        return trace_config
+
+    def snapshot(self):
+        with self._lock:
+            elapsed = time.monotonic() - self.started
+            done = sum(self.outcomes.values())
+            return {
+                'elapsed_seconds': elapsed,
+                'total': self.total,
+                'done': done,
+                'outcomes': dict(self.outcomes),
+                'bytes': self.bytes,
+                'items_per_second': done / elapsed if elapsed else 0.0,
+                'bytes_per_second': self.bytes / elapsed if elapsed else 0.0,
+                'hosts': {host: stats.summary() for host, stats in self.hosts.items()},
+            }
+
+    # Function to write a snapshot: Prometheus textfile format for *.prom paths, JSON otherwise.
+    # Written to a temp file and renamed, so a collector never reads half a file.
+    def export(self, path):
+        content = prometheus_text(self) if path.endswith('.prom') else json.dumps(self.snapshot(), indent=2)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        os.replace(temp_path, path)
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+# Function to render the metrics in the Prometheus text exposition format
+def prometheus_text(metrics):
+    with metrics._lock:
+        lines = [
+            '# TYPE image_run_items_total counter',
+            *(f'image_run_items_total{{outcome="{_label(outcome)}"}} {count}'
+              for outcome, count in sorted(metrics.outcomes.items())),
+            '# TYPE image_run_elapsed_seconds gauge',
+            f'image_run_elapsed_seconds {time.monotonic() - metrics.started:.3f}',
+        ]
+        if metrics.total is not None:
+            lines += ['# TYPE image_run_items_expected gauge', f'image_run_items_expected {metrics.total}']
+        lines.append('# TYPE image_http_requests_total counter')
+        for host, stats in sorted(metrics.hosts.items()):
+            for status, count in sorted(stats.statuses.items()):
+                lines.append(f'image_http_requests_total{{host="{_label(host)}",status="{_label(status)}"}} {count}')
+        lines.append('# TYPE image_http_concurrency_limit gauge')
+        for host, stats in sorted(metrics.hosts.items()):
+            if stats.concurrency_limit is not None:
+                lines.append(f'image_http_concurrency_limit{{host="{_label(host)}"}} {stats.concurrency_limit}')
+        lines.append('# TYPE image_http_response_bytes_total counter')
+        for host, stats in sorted(metrics.hosts.items()):
+            lines.append(f'image_http_response_bytes_total{{host="{_label(host)}"}} {stats.bytes}')
+        for name in ('connect', 'ttfb', 'transfer'):
+            metric = f'image_http_{name}_seconds'
+            lines.append(f'# TYPE {metric} histogram')
+            for host, stats in sorted(metrics.hosts.items()):
+                histogram = getattr(stats, name)
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{host="{_label(host)}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{host="{_label(host)}"}} {histogram.total:.6f}')
+                lines.append(f'{metric}_count{{host="{_label(host)}"}} {histogram.count}')
+    return '\n'.join(lines) + '\n'
+
+def _duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+# One live progress line (done/total, rate, throughput, ETA, failures) redrawn from a background
+# thread, plus an optional metrics export every export_interval seconds and at the end.
+# Messages worth keeping (failures) go through log() so they print above the line.
+class ProgressReporter:
+    def __init__(self, metrics, label='images', interval=1.0, export_path=None, export_interval=None,
+                 stream=None):
+        self.metrics = metrics
+        self.label = label
+        self.interval = interval
+        self.export_path = export_path
+        self.export_interval = export_interval
+        self.stream = stream or sys.stderr
+        self.live = self.stream.isatty()
+        self._print_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name='progress', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Function to stop the line, print the final summary and write the final export
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self._draw(final=True)
+        if self.export_path:
+            self.metrics.export(self.export_path)
+
+    def log(self, message):
+        with self._print_lock:
+            if self.live:
+                self.stream.write('\r\033[K')
+            self.stream.write(message + '\n')
+            self.stream.flush()
+
+    def line(self):
+        snapshot = self.metrics.snapshot()
+        done, total = snapshot['done'], snapshot['total']
+        rate = snapshot['items_per_second']
+        parts = [f"{done}/{total}" if total is not None else f"{done}", self.label,
+                 f"{rate:.1f}/s", f"{snapshot['bytes_per_second'] / 1e6:.1f} MB/s"]
+        failed = snapshot['outcomes'].get('failed', 0)
+        if failed:
+            parts.append(f"{failed} failed")
+        if total is not None and rate > 0 and done < total:
+            parts.append(f"ETA {_duration((total - done) / rate)}")
+        parts.append(f"elapsed {_duration(snapshot['elapsed_seconds'])}")
+        return "  ".join(parts)
+
+    def _draw(self, final=False):
+        with self._print_lock:
+            if self.live:
+                self.stream.write('\r\033[K' + self.line() + ('\n' if final else ''))
+            elif final:
+                self.stream.write(self.line() + '\n')
+            self.stream.flush()
+
+    def _loop(self):
+        last_export = last_print = time.monotonic()
+        while not self._stop.wait(self.interval):
+            now = time.monotonic()
+            if self.live:
+                self._draw()
+            elif now - last_print >= 10 * self.interval:  # Not a terminal: an occasional full line
+                last_print = now
+                with self._print_lock:
+                    self.stream.write(self.line() + '\n')
+                    self.stream.flush()
+            if self.export_path and self.export_interval and now - last_export >= self.export_interval:
+                last_export = now
+                self.metrics.export(self.export_path)
@@ -0,0 +1,88 @@
+import concurrent.futures
+import queue
+import threading
+from functools import partial
+
+from retry_scheduler import RetryingExecutor, host_of
+
+_DONE = object()
+
+# Tracks how many of a part's images are still in flight
+class _PartProgress:
+    def __init__(self, remaining):
+        self.total = remaining
+        self.remaining = remaining
+        self.downloaded = 0
+
+# Two-stage pipeline: scrape workers resolve (part_number, image URLs) and hand them to a
+# separate, larger download pool through a bounded queue. Browser slots never wait on image
+# transfers, and scraping pauses when downloads fall behind.
+#   scrape(part_number) -> list of absolute image URLs (empty/None when nothing was found)
+#   download(part_number, index, url) -> True once that image is on disk, False on a permanent
+#       failure; raises RetryLater on a transient one, which is retried from a delay queue
+#   on_image_failed(part_number, index, url, reason) runs when an image is given up on
+#   on_part_done(part_number, num_downloaded) runs once every image of a part is on disk
+#   on_part_incomplete(part_number, num_downloaded) runs instead when some of a part's images
+#       were given up on, so the part can be left for the next run
+#   log(message) reports parts that could not be scraped and hosts the download stage pauses
+def run_pipeline(part_numbers, scrape, download, on_image_failed, on_part_done, on_part_incomplete=None,
+                 scrape_workers=10, download_workers=32, queue_size=50, log=print):
+    scraped = queue.Queue(maxsize=queue_size)
+    # Bounds the images submitted to the download pool, so the queue above really applies backpressure
+    download_slots = threading.BoundedSemaphore(download_workers * 2)
+    progress_lock = threading.Lock()
+
+    def scrape_one(part_number):
+        try:
+            image_urls = scrape(part_number)
+        except Exception as e:
+            log(f"Error scraping {part_number}: {e}")
+            return
+        if image_urls:
+            scraped.put((part_number, image_urls))  # Blocks while the download stage is behind
+        else:
+            log(f"No images found for {part_number}")
+
+    def image_done(part_number, index, url, progress, ok, reason):
+        download_slots.release()
+        if not ok:
+            on_image_failed(part_number, index, url, reason)
+        with progress_lock:
+            if ok:
+                progress.downloaded += 1
+            progress.remaining -= 1
+            finished = progress.remaining == 0
+        if not finished:
+            return
+        if progress.downloaded == progress.total:
+            on_part_done(part_number, progress.downloaded)
+        elif on_part_incomplete:
+            on_part_incomplete(part_number, progress.downloaded)
+
+    def scrape_stage():
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=scrape_workers) as executor:
+                executor.map(scrape_one, part_numbers)
+        finally:
+            scraped.put(_DONE)
+
+    scraper = threading.Thread(target=scrape_stage, name='scrape-stage')
+    scraper.start()
+    executor = RetryingExecutor(max_workers=download_workers, log=log)
+    try:
+        while True:
+            item = scraped.get()
+            if item is _DONE:
+                break
+            part_number, image_urls = item
+            progress = _PartProgress(len(image_urls))
+            for index, url in enumerate(image_urls, start=1):
+                download_slots.acquire()
+                executor.submit(
+                    partial(download, part_number, index, url),
+                    host_of(url),
+                    partial(image_done, part_number, index, url, progress),
+                )
+    finally:
+        executor.shutdown()
+        scraper.join()
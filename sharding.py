@@ -0,0 +1,162 @@
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import namedtuple
+
+from run_manifest import RunManifest
+
+# One slice of a catalog run: shard index (counted from 0) of count shards
+Shard = namedtuple('Shard', ['index', 'count'])
+
+# Function to get the shard (0..shard_count-1) a part number belongs to.
+# Uses a digest rather than hash(): str hashes are salted per process, and every process and
+# machine working on the run must agree on the split.
+def shard_of(part_number, shard_count):
+    digest = hashlib.blake2b(str(part_number).strip().encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % shard_count
+
+# Function to check whether a part number belongs to a shard (always true without one)
+def in_shard(part_number, shard):
+    return shard is None or shard_of(part_number, shard.count) == shard.index
+
+# Function to parse a --shard value like "3/8" (argparse type)
+def parse_shard(value):
+    index, _, count = value.partition('/')
+    try:
+        shard = Shard(int(index), int(count))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected INDEX/COUNT like 0/4, got {value!r}")
+    if not 0 <= shard.index < shard.count:
+        raise argparse.ArgumentTypeError(f"shard index must be between 0 and {shard.count - 1}")
+    return shard
+
+def shard_name(shard):
+    return f"shard-{shard.index:02d}-of-{shard.count:02d}"
+
+# Function to get a shard's own copy of a run file: download_manifest.sqlite becomes
+# download_manifest.shard-02-of-04.sqlite next to it
+def shard_path(path, shard):
+    if shard is None:
+        return path
+    base, extension = os.path.splitext(path)
+    return f"{base}.{shard_name(shard)}{extension}"
+
+# Function to add the sharding options to a script's argument parser
+def add_shard_arguments(parser):
+    parser.add_argument('--shards', type=int, metavar='N',
+                        help="Split the run by part number into N worker processes on this machine and merge their results")
+    parser.add_argument('--shard', type=parse_shard, metavar='I/N',
+                        help="Work only on shard I of N (counted from 0), e.g. one shard per machine")
+    parser.add_argument('--merge-shards', type=int, metavar='N',
+                        help="Merge the manifests and logs of N finished shards into one report")
+
+# Function to open the manifest a run works on: the shared one, or a shard's own file seeded
+# with the shard's rows from the shared one (so finished images are still skipped)
+def open_manifest(manifest_path, shard=None):
+    if shard is None:
+        return RunManifest(manifest_path)
+    manifest = RunManifest(shard_path(manifest_path, shard))
+    if os.path.exists(manifest_path):
+        manifest.merge_from(manifest_path, keep=lambda part_number: in_shard(part_number, shard))
+    return manifest
+
+# Function to run this script once per shard as independent worker processes and wait for all.
+# Each worker gets the same command line plus --shard I/N and writes its output to a log file in
+# log_folder. Returns the exit codes by shard index.
+def launch_shards(shard_count, log_folder):
+    workers = []
+    for index in range(shard_count):
+        shard = Shard(index, shard_count)
+        log_path = os.path.join(log_folder, f"{shard_name(shard)}.log")
+        log_file = open(log_path, 'w', encoding='utf-8')
+        command = [sys.executable, sys.argv[0], *sys.argv[1:], '--shard', f"{index}/{shard_count}"]
+        workers.append((shard, log_path, log_file,
+                        subprocess.Popen(command, stdout=log_file, stderr=subprocess.STDOUT)))
+        print(f"Started {shard_name(shard)} (pid {workers[-1][3].pid}), log: {log_path}")
+
+    exit_codes = []
+    for shard, log_path, log_file, process in workers:
+        exit_codes.append(process.wait())
+        log_file.close()
+        print(f"{shard_name(shard)} finished with exit code {exit_codes[-1]}")
+    return exit_codes
+
+# Function to append every shard's copy of an append-only file (journal, CSV log) to the shared
+# file and remove it; header_lines of each shard file are skipped when the shared file already has them
+def append_shard_files(path, shard_count, header_lines=0):
+    for index in range(shard_count):
+        part_path = shard_path(path, Shard(index, shard_count))
+        if not os.path.exists(part_path):
+            continue
+        has_header = os.path.exists(path)
+        with open(part_path, 'r', encoding='utf-8', newline='') as source, \
+                open(path, 'a', encoding='utf-8', newline='') as target:
+            for line_number, line in enumerate(source):
+                if line_number < header_lines and has_header:
+                    continue
+                target.write(line)
+        os.remove(part_path)
+
+# Function to read the last failure reason of every (part_number, url) from JSONL journals
+def failure_reasons(journal_paths):
+    reasons = {}
+    for path in journal_paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # A line cut short by a crash
+                if entry.get('status') == 'failed':
+                    reasons[(entry['part_number'], entry['image_url'])] = entry.get('reason')
+    return reasons
+
+# Function to fold the manifests of shard_count finished shards (and their journals, if the run
+# keeps one) into the shared files and write one report for the whole run to report_path.
+# Shard files are removed once merged, so merging twice is harmless.
+def merge_shards(manifest_path, shard_count, report_path, journal_path=None):
+    shards = [Shard(index, shard_count) for index in range(shard_count)]
+    journal_paths = [shard_path(journal_path, shard) for shard in shards] if journal_path else []
+    reasons = failure_reasons(journal_paths)
+
+    report = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'shards': {}, 'missing_shards': []}
+    with RunManifest(manifest_path) as manifest:
+        for shard in shards:
+            part_manifest_path = shard_path(manifest_path, shard)
+            if not os.path.exists(part_manifest_path):
+                report['missing_shards'].append(shard.index)
+                continue
+            with RunManifest(part_manifest_path) as part_manifest:
+                report['shards'][shard_name(shard)] = part_manifest.status_counts()
+            manifest.merge_from(part_manifest_path)
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(part_manifest_path + suffix):
+                    os.remove(part_manifest_path + suffix)
+        report['totals'] = manifest.status_counts()
+        report['failed'] = [
+            {'part_number': part_number, 'image_url': url, 'path': path,
+             'reason': reasons.get((str(part_number), url))}
+            for part_number, url, path in manifest.failed_rows()
+        ]
+    if journal_path:
+        append_shard_files(journal_path, shard_count)
+
+    with open(report_path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2)
+    return report
+
+# Function to print the per-shard and overall counts of a merged report
+def print_shard_report(report, report_path):
+    for name, counts in report['shards'].items():
+        print(f"{name}: " + ", ".join(f"{count} {status}" for status, count in sorted(counts.items())))
+    if report['missing_shards']:
+        print(f"No manifest found for shard(s) {', '.join(map(str, report['missing_shards']))}")
+    totals = sorted(report['totals'].items())
+    print("All shards: " + (", ".join(f"{count} {status}" for status, count in totals) or "nothing recorded"))
+    print(f"Report with {len(report['failed'])} failed image(s) written to {report_path}")
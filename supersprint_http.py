@@ -0,0 +1,90 @@
+import os
+import threading
+from urllib.parse import quote_plus, urljoin, urlsplit
+
+import requests
+from bs4 import BeautifulSoup
+
+# Site root; point it at a local stand-in server (serving recorded pages) to try the fast path offline
+BASE_URL = os.environ.get('SUPERSPRINT_BASE_URL', 'https://www.supersprint.com').rstrip('/')
+
+# Page the search box submits to
+SEARCH_PATH = os.environ.get('SUPERSPRINT_SEARCH_PATH', '/en-us/search.aspx?q={part_number}')
+
+# lxml is several times faster than html.parser; use it when it is installed
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+_local = threading.local()
+
+# Function to get this thread's pooled keep-alive session
+def get_session():
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers['User-Agent'] = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'
+        _local.session = session
+    return session
+
+# Function to pull the carousel image URLs out of a product page
+def parse_product_image_urls(html):
+    soup = BeautifulSoup(html, HTML_PARSER)
+    image_urls = []
+    for swiper_slide in soup.find_all('div', {'class': 'swiper-slide'}):
+        img_tag = swiper_slide.find('img', {'class': 'system-components-pack-item-image'})
+        if img_tag and img_tag.get('src'):
+            image_urls.append(img_tag['src'])
+    return image_urls
+
+# Function to find the link to the product page for a part number on a search results page.
+# The part number must be the page's slug (/products/ss-1001.aspx) or a whole word of the link
+# text, so SS-100 never picks up SS-1001. Returns None when no link or more than one product matches.
+def find_product_link(html, part_number):
+    soup = BeautifulSoup(html, HTML_PARSER)
+    wanted = part_number.strip().lower()
+    matches = set()
+    for link in soup.find_all('a', href=True):
+        href = link['href']
+        if 'search' in href.lower():
+            continue  # Pagination / "search again" links echo the query
+        slug = os.path.splitext(urlsplit(href).path.rstrip('/').rsplit('/', 1)[-1])[0].lower()
+        words = {word.strip('.,;:()[]"\'') for word in link.get_text(' ', strip=True).lower().split()}
+        if slug == wanted or wanted in words:
+            matches.add(href)
+    return matches.pop() if len(matches) == 1 else None
+
+# Function to turn a src/href from the site into an absolute URL
+def absolute_url(url):
+    return urljoin(BASE_URL + '/', url)
+
+# Function to resolve a part number's image URLs with plain HTTP (no browser).
+# Returns None when the pages don't look like we expect, so the caller can fall back to Selenium.
+# log(message) reports requests that failed outright.
+def resolve_product_image_urls(part_number, timeout=10, log=print):
+    session = get_session()
+    try:
+        response = session.get(BASE_URL + SEARCH_PATH.format(part_number=quote_plus(part_number)), timeout=timeout)
+        if response.status_code != 200:
+            return None
+
+        # The search can land straight on the product page
+        image_urls = parse_product_image_urls(response.text)
+        if image_urls:
+            return image_urls
+
+        product_link = find_product_link(response.text, part_number)
+        if not product_link:
+            return None
+        response = session.get(urljoin(response.url, product_link), timeout=timeout)
+        if response.status_code != 200:
+            return None
+        return parse_product_image_urls(response.text) or None
+    except requests.exceptions.RequestException as e:
+        log(f"HTTP fast path failed for {part_number}: {e}")
+        return None
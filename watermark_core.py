@@ -0,0 +1,148 @@
+import os
+import time
+
+import cv2
+import numpy as np
+
+# Share of sampled images that must have an edge at a pixel for it to count as watermark
+MASK_CONSENSUS = 0.6
+
+# Inpainting radius, and the context kept around each masked region in ROI mode
+INPAINT_RADIUS = 3
+ROI_PADDING = 16
+ROI_GRID = 8
+
+# Shared masks already loaded in this process, keyed by cache file
+_loaded_masks = {}
+
+# Function to find likely watermark areas: edge map -> large external contours -> filled mask
+def detect_watermark_mask(image):
+    # Convert image to grayscale
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    # Use edge detection (Canny)
+    edges = cv2.Canny(gray, 50, 150)  # Adjust threshold if needed
+
+    # Apply threshold to highlight watermark
+    _, thresh = cv2.threshold(edges, 50, 255, cv2.THRESH_BINARY)
+
+    # Find contours (possible watermark areas)
+    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    # Create a mask for detected watermark
+    mask = np.zeros_like(gray)
+
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if w > 50 and h > 10:  # Filter small noise (adjust values)
+            cv2.drawContours(mask, [contour], -1, (255), thickness=cv2.FILLED)
+    return mask
+
+# Function to get an image's edge map (True where Canny finds an edge)
+def edge_map(image):
+    return cv2.Canny(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), 50, 150) > 0
+
+# Function to estimate one watermark mask from per-pixel edge counts over sample_count same-sized images.
+# A supplier's watermark sits in the same place on every image while product edges move around,
+# so only pixels that are edges in most of the sample are kept.
+def estimate_shared_mask(edge_counts, sample_count, consensus=MASK_CONSENSUS):
+    mask = np.where(edge_counts >= consensus * sample_count, 255, 0).astype(np.uint8)
+
+    # Edges only outline the watermark strokes; grow them to cover the strokes themselves
+    return cv2.dilate(mask, np.ones((5, 5), np.uint8))
+
+# Function to get where the shared mask for a supplier and image size (height, width) is cached
+def mask_cache_path(cache_folder, supplier, shape):
+    return os.path.join(cache_folder, f"{supplier}_{shape[1]}x{shape[0]}.png")
+
+# Function to estimate and cache a shared mask for every image size that has enough samples.
+# Each sampled image is folded into a running edge count for its size as soon as it is read, so
+# memory holds one count array per size rather than every sampled image at full resolution.
+def build_mask_cache(input_paths, cache_folder, supplier, sample_size=50, min_samples=5, rebuild=False):
+    os.makedirs(cache_folder, exist_ok=True)
+    tallies = {}  # (height, width) -> [edge counts, images counted], or None when already cached
+    for input_path in input_paths[:sample_size * 4]:
+        image = cv2.imread(input_path)
+        if image is None:
+            continue
+        shape = image.shape[:2]
+        if shape not in tallies:
+            cached = os.path.exists(mask_cache_path(cache_folder, supplier, shape)) and not rebuild
+            tallies[shape] = None if cached else [np.zeros(shape, dtype=np.uint16), 0]
+        tally = tallies[shape]
+        if tally is not None and tally[1] < sample_size:
+            tally[0] += edge_map(image)
+            tally[1] += 1
+
+    built = []
+    for shape, tally in tallies.items():
+        if tally is None or tally[1] < min_samples:
+            continue
+        cache_path = mask_cache_path(cache_folder, supplier, shape)
+        cv2.imwrite(cache_path, estimate_shared_mask(*tally))
+        built.append(cache_path)
+    return built
+
+# Function to load the cached shared mask for an image size (None when there is none)
+def load_shared_mask(cache_folder, supplier, shape):
+    cache_path = mask_cache_path(cache_folder, supplier, shape)
+    if cache_path not in _loaded_masks:
+        mask = cv2.imread(cache_path, cv2.IMREAD_GRAYSCALE) if os.path.exists(cache_path) else None
+        _loaded_masks[cache_path] = mask
+    return _loaded_masks[cache_path]
+
+# Function to inpaint the masked pixels
+def remove_watermark(image, mask):
+    return cv2.inpaint(image, mask, inpaintRadius=INPAINT_RADIUS, flags=cv2.INPAINT_TELEA)
+
+# Function to inpaint only padded crops around the masked regions, writing them back into
+# image in place. Cost scales with the watermark's area instead of the full resolution.
+def remove_watermark_roi(image, mask, padding=ROI_PADDING):
+    height, width = mask.shape
+
+    # Find the regions on a mask shrunk by ROI_GRID (any masked pixel marks its cell), which is far
+    # cheaper than labelling the full-resolution mask. Growing it by the padding merges nearby
+    # strokes, so each component is one padded crop.
+    small = cv2.resize(mask, (-(-width // ROI_GRID), -(-height // ROI_GRID)), interpolation=cv2.INTER_AREA)
+    cells = -(-padding // ROI_GRID)
+    grown = cv2.dilate((small > 0).astype(np.uint8), np.ones((2 * cells + 1, 2 * cells + 1), np.uint8))
+    count, _, stats, _ = cv2.connectedComponentsWithStats(grown, connectivity=8)
+
+    # Crops covering most of the frame gain nothing over one full-frame pass
+    if stats[1:, cv2.CC_STAT_AREA].sum() > 0.5 * grown.size:
+        image[:] = remove_watermark(image, mask)
+        return image
+
+    for label in range(1, count):  # Label 0 is the background
+        x, y, w, h = stats[label, :4] * ROI_GRID
+        x1, y1 = min(width, x + w), min(height, y + h)
+        crop_mask = mask[y:y1, x:x1]
+        if not crop_mask.any():
+            continue
+        image[y:y1, x:x1] = remove_watermark(image[y:y1, x:x1], crop_mask)
+    return image
+
+# Function to clean one image; returns (filename, seconds taken or None if it could not be read).
+# shared_masks is an optional (cache_folder, supplier) pair: a cached mask for the image's size is
+# used as-is, and only images without one fall back to per-image detection.
+# roi=True inpaints only crops around the mask instead of the full frame.
+def process_image(input_path, output_path, shared_masks=None, roi=False):
+    start = time.perf_counter()
+    image = cv2.imread(input_path)
+    if image is None:
+        return os.path.basename(input_path), None
+
+    mask = load_shared_mask(*shared_masks, image.shape[:2]) if shared_masks else None
+    if mask is None:
+        mask = detect_watermark_mask(image)
+    if roi:
+        cv2.imwrite(output_path, remove_watermark_roi(image, mask))
+    else:
+        cv2.imwrite(output_path, remove_watermark(image, mask))
+    return os.path.basename(input_path), time.perf_counter() - start
+
+# Function run in each worker process: clean a chunk of (input_path, output_path) pairs
+def process_chunk(jobs, shared_masks=None, roi=False):
+    # One process per core already; keep OpenCV from spawning its own threads on top
+    cv2.setNumThreads(1)
+    return [process_image(input_path, output_path, shared_masks, roi) for input_path, output_path in jobs]